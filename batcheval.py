@@ -0,0 +1,108 @@
+"""
+Vectorised PeSTO evaluation of many positions at once.
+
+Positions come in as an (N, 8) uint64 array of bitboards, laid out like the first 8
+fields of Board.encode_position() (see epd.read_epd_batches()). Each chunk of rows is
+unpacked into per-square occupancy for every side and piece, and one matrix product
+against the flattened lookuptables scores gives the middlegame score, endgame score
+and game phase of every row. Results match Board.evaluate() exactly.
+
+Run with: python batcheval.py
+"""
+
+import time
+
+import numpy as np
+import numpy.typing as npt
+
+import lookuptables
+
+WHITE_SIDE = 0
+BLACK_SIDE = 1
+PIECE_COUNT = 6
+BOARD_AREA = 64
+MAX_GAME_PHASE = 24
+
+# Rows unpacked at a time - each one takes 768 float32 features, so this bounds memory use
+CHUNK_SIZE = 4096
+
+
+def build_weights() -> npt.NDArray[np.float32]:
+    """Return a (768, 3) matrix of (mg score, eg score, phase) for every (side, piece, square) feature."""
+    weights = np.zeros((2, PIECE_COUNT, BOARD_AREA, 3), dtype=np.float32)
+    for side in [WHITE_SIDE, BLACK_SIDE]:
+        for piece_id in range(PIECE_COUNT):
+            weights[side, piece_id, :, 0] = lookuptables.MG_SQUARE_SCORES[side][piece_id]
+            weights[side, piece_id, :, 1] = lookuptables.EG_SQUARE_SCORES[side][piece_id]
+            weights[side, piece_id, :, 2] = lookuptables.GAMEPHASE_INC[piece_id]
+    # Every partial sum is an integer well under 2**24, so float32 products stay exact
+    return weights.reshape(2 * PIECE_COUNT * BOARD_AREA, 3)
+
+WEIGHTS = build_weights()
+
+
+def unpack_occupancy(bitboards: npt.NDArray[np.uint64]) -> npt.NDArray[np.uint8]:
+    """Return an (N, 8, 64) array with a 1 wherever each bitboard has a bit set, indexed by bit position."""
+    as_bytes = bitboards.astype("<u8").view(np.uint8).reshape(len(bitboards), 8, 8)
+    return np.unpackbits(as_bytes, axis=2, bitorder="little")
+
+def evaluate_terms(bitboards: npt.NDArray[np.uint64]) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    """Return (mg_score, eg_score, game_phase) arrays for an (N, 8) bitboard array, scores from white's point of view."""
+    terms = np.empty((len(bitboards), 3), dtype=np.int64)
+    for start in range(0, len(bitboards), CHUNK_SIZE):
+        occupancy = unpack_occupancy(bitboards[start:start + CHUNK_SIZE])
+        # (N, 2, 1, 64) & (N, 1, 6, 64) -> one plane per side and piece
+        features = occupancy[:, :2, None, :] & occupancy[:, None, 2:, :]
+        features = features.reshape(len(occupancy), -1).astype(np.float32)
+        terms[start:start + CHUNK_SIZE] = features @ WEIGHTS
+    return terms[:, 0], terms[:, 1], terms[:, 2]
+
+def evaluate_batch(bitboards: npt.NDArray[np.uint64], side_to_move: npt.ArrayLike = None) -> npt.NDArray[np.int64]:
+    """Return the tapered PeSTO score of every row in centipawns.
+
+    Scores are from the side to move's point of view when side_to_move (0 white, 1 black per row)
+    is given, as Board.evaluate() does, and from white's point of view otherwise."""
+    mg_score, eg_score, game_phase = evaluate_terms(np.asarray(bitboards, dtype=np.uint64))
+    mg_phase = np.minimum(game_phase, MAX_GAME_PHASE)
+    scores = (mg_score * mg_phase + eg_score * (MAX_GAME_PHASE - mg_phase)) // MAX_GAME_PHASE
+    if side_to_move is not None:
+        scores = np.where(np.asarray(side_to_move) == BLACK_SIDE, -scores, scores)
+    return scores
+
+
+if __name__ == "__main__":
+    import random
+
+    import newboard
+
+    # Sample positions from seeded random games, then check every one against the scalar evaluator
+    rng = random.Random(0)
+    boards = []
+    while len(boards) < 2000:
+        board = newboard.IntBoard(None, "w")
+        for _ in range(100):
+            legal_moves = board.generate_legal_moves()
+            if not legal_moves:
+                break
+            board.make_move(rng.choice(legal_moves))
+            boards.append(newboard.IntBoard.from_encoding(board.encode_position()))
+
+    encodings = np.array([board.encode_position() for board in boards], dtype=np.uint64)
+    bitboards = encodings[:, :8]
+    side_to_move = encodings[:, 8]
+    scores = evaluate_batch(bitboards, side_to_move)
+    assert scores.tolist() == [board.evaluate() for board in boards], "batch evaluation disagrees with Board.evaluate"
+
+    repeats = 200
+    batch = np.tile(bitboards, (repeats, 1))
+    start = time.perf_counter()
+    evaluate_batch(batch, np.tile(side_to_move, repeats))
+    seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for board in boards:
+        board.compute_evaluation()
+    scalar_seconds = time.perf_counter() - start
+
+    print(f"{len(batch)} positions in {seconds:.3f}s: {len(batch) / seconds:.0f} positions/s")
+    print(f"Scalar full recomputation: {len(boards) / scalar_seconds:.0f} positions/s")
@@ -0,0 +1,248 @@
+"""
+Move generation benchmarks for newboard.
+
+python benchmark.py runs the regression suite: perft on a corpus of standard positions
+with known node counts, plus nodes/s for generate_legal_moves, make_move/unmake_move,
+in_check and perft. Results are compared against a stored baseline JSON and any
+slowdown past the threshold is flagged. Use --save-baseline to record a new baseline.
+
+python benchmark.py --backends compares the NumPy backed Board against the plain int
+IntBoard on the same set of positions.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import newboard
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# name -> (FEN, perft node counts for depth 1, 2, ...), counts are the published ones for each position
+PERFT_POSITIONS = {
+    "start": ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+              [20, 400, 8902, 197281, 4865609]),
+    "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                 [48, 2039, 97862, 4085603]),
+    "endgame": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+                [14, 191, 2812, 43238, 674624]),
+    "promotions": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+                   [6, 264, 9467, 422333]),
+    "middlegame": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+                   [44, 1486, 62379, 2103487]),
+    "castling": ("r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1",
+                 [26, 1141, 27826, 1274206]),
+    "en_passant_pin": ("8/8/8/8/k2Pp2Q/8/8/3K4 b - d3 0 1",
+                       [6, 136, 863, 20471, 117741]),
+    "underpromotion": ("n1n5/PPPk4/8/8/8/8/4Kppp/5N1N b - - 0 1",
+                       [24, 496, 9483, 182838]),
+}
+
+
+def sample_move_sequences(count: int, length: int, seed: int = 0) -> list[list[int]]:
+    """Play seeded random games and return the moves leading to each sampled position."""
+    rng = random.Random(seed)
+    sequences = []
+    while len(sequences) < count:
+        board = newboard.IntBoard(None, "w")
+        moves = []
+        for _ in range(length):
+            legal_moves = board.generate_legal_moves()
+            if not legal_moves:
+                break
+            move = rng.choice(legal_moves)
+            board.make_move(move)
+            moves.append(move)
+            sequences.append(list(moves))
+    return sequences[:count]
+
+def setup_positions(board_class, sequences: list[list[int]]) -> list:
+    boards = []
+    for moves in sequences:
+        board = board_class(None, "w")
+        for move in moves:
+            board.make_move(move)
+        boards.append(board)
+    return boards
+
+def time_legal_moves(boards: list, repeats: int) -> tuple[float, int]:
+    """Return (seconds, moves generated) for generate_legal_moves over every position."""
+    moves = 0
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for board in boards:
+            moves += len(board.generate_legal_moves())
+    return time.perf_counter() - start, moves
+
+def time_pseudo_legal_moves(boards: list, repeats: int) -> tuple[float, int]:
+    """Return (seconds, moves generated) for the per-piece generators, with no legality check."""
+    moves = 0
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for board in boards:
+            white_bitboard = board.side_bitboards[board.WHITE_SIDE]
+            black_bitboard = board.side_bitboards[board.BLACK_SIDE]
+            current_board = white_bitboard | black_bitboard
+            while current_board != 0:
+                current_position = board.ONE << board.return_lsb_position(current_board)
+                if board.piece_bitboards[board.PAWN_ID] & current_position:
+                    moves += len(board.generate_pawn_moves(current_position, white_bitboard, black_bitboard))
+                elif board.piece_bitboards[board.KNIGHT_ID] & current_position:
+                    moves += len(board.generate_knight_moves(current_position, white_bitboard, black_bitboard))
+                elif board.piece_bitboards[board.KING_ID] & current_position:
+                    moves += len(board.generate_king_moves(current_position, white_bitboard, black_bitboard))
+                else:
+                    for piece_id in [board.ROOK_ID, board.BISHOP_ID, board.QUEEN_ID]:
+                        if board.piece_bitboards[piece_id] & current_position:
+                            moves += len(board.generate_sliding_moves(current_position, white_bitboard, black_bitboard, piece_id))
+                current_board ^= current_position
+    return time.perf_counter() - start, moves
+
+def benchmark_backends(positions: int = 40, repeats: int = 3):
+    sequences = sample_move_sequences(positions, 30)
+    results = {}
+    for board_class in [newboard.Board, newboard.IntBoard]:
+        boards = setup_positions(board_class, sequences)
+        results[board_class.__name__] = {
+            "legal": time_legal_moves(boards, repeats),
+            "pseudo-legal": time_pseudo_legal_moves(boards, repeats),
+        }
+
+    print(f"{len(sequences)} positions, {repeats} repeats")
+    for name in ["legal", "pseudo-legal"]:
+        numpy_seconds, numpy_moves = results["Board"][name]
+        int_seconds, int_moves = results["IntBoard"][name]
+        assert numpy_moves == int_moves, "backends disagree on move generation"
+        print(f"{name:>12}: Board {numpy_moves / numpy_seconds:10.0f} moves/s | IntBoard {int_moves / int_seconds:10.0f} moves/s | speedup {numpy_seconds / int_seconds:.2f}x")
+
+
+# REGRESSION SUITE
+
+def setup_suite_positions(board_class) -> list:
+    """Return every corpus position and every position one move in, for the per-operation timings."""
+    boards = []
+    for fen, _ in PERFT_POSITIONS.values():
+        board = board_class.from_fen(fen)
+        boards.append(board)
+        for move in board.generate_legal_moves():
+            board.make_move(move)
+            boards.append(board_class.from_encoding(board.encode_position()))
+            board.unmake_move()
+    return boards
+
+def time_make_unmake(boards: list, repeats: int) -> tuple[float, int]:
+    """Return (seconds, moves made) for making and unmaking every legal move of every position."""
+    move_lists = [board.generate_legal_moves() for board in boards]
+    moves = 0
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for board, legal_moves in zip(boards, move_lists):
+            for move in legal_moves:
+                board.make_move(move)
+                board.unmake_move()
+            moves += len(legal_moves)
+    return time.perf_counter() - start, moves
+
+def time_in_check(boards: list, repeats: int) -> tuple[float, int]:
+    """Return (seconds, calls) for in_check on both sides of every position."""
+    calls = 0
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for board in boards:
+            # The boards are reused on every repeat, so forget the cached attack maps
+            # (see Board.attacked_squares) - otherwise only the first repeat does any work
+            board.attack_maps[0] = board.attack_maps[1] = None
+            board.in_check(board.WHITE_SIDE)
+            board.in_check(board.BLACK_SIDE)
+            calls += 2
+    return time.perf_counter() - start, calls
+
+def time_perft(board_class, max_nodes: int) -> tuple[float, int, list[str]]:
+    """Return (seconds, nodes, failures) for perft on each corpus position, to the deepest depth with at most max_nodes nodes."""
+    seconds = 0.0
+    nodes = 0
+    failures = []
+    for name, (fen, counts) in PERFT_POSITIONS.items():
+        board = board_class.from_fen(fen)
+        depth = max(1, sum(1 for count in counts if count <= max_nodes))
+        start = time.perf_counter()
+        result = board.perft(depth)
+        seconds += time.perf_counter() - start
+        nodes += result
+        if result != counts[depth - 1]:
+            failures.append(f"{name} perft({depth}) = {result}, expected {counts[depth - 1]}")
+    return seconds, nodes, failures
+
+def run_suite(board_class, repeats: int = 3, max_nodes: int = 200000) -> tuple[dict, list[str]]:
+    """Return ({benchmark name: operations per second}, perft failures)."""
+    boards = setup_suite_positions(board_class)
+    perft_seconds, perft_nodes, failures = time_perft(board_class, max_nodes)
+    timings = {
+        "generate_legal_moves": time_legal_moves(boards, repeats),
+        "make_unmake": time_make_unmake(boards, repeats),
+        "in_check": time_in_check(boards, repeats),
+        "perft": (perft_seconds, perft_nodes),
+    }
+    return {name: count / seconds for name, (seconds, count) in timings.items()}, failures
+
+def compare_with_baseline(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Return a line for every benchmark more than threshold (a fraction) slower than the baseline."""
+    slowdowns = []
+    for name, rate in results.items():
+        if name not in baseline:
+            continue
+        change = rate / baseline[name] - 1
+        if change < -threshold:
+            slowdowns.append(f"{name}: {rate:.0f}/s vs baseline {baseline[name]:.0f}/s ({change:+.1%})")
+    return slowdowns
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", action="store_true", help="compare Board against IntBoard instead of running the suite")
+    parser.add_argument("--board", choices=["Board", "IntBoard"], default="IntBoard", help="backend to run the suite on")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="write this run's results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown (as a fraction) that gets flagged")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--max-nodes", type=int, default=200000, help="largest perft each corpus position is run to")
+    args = parser.parse_args(argv)
+
+    if args.backends:
+        benchmark_backends()
+        return 0
+
+    results, failures = run_suite(getattr(newboard, args.board), args.repeats, args.max_nodes)
+    print(f"{args.board}, {len(PERFT_POSITIONS)} perft positions")
+    for name, rate in results.items():
+        print(f"{name:>20}: {rate:10.0f}/s")
+    for failure in failures:
+        print(f"PERFT MISMATCH {failure}")
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baselines = json.load(file)
+
+    slowdowns = []
+    if args.save_baseline:
+        baselines[args.board] = results
+        with open(args.baseline, "w") as file:
+            json.dump(baselines, file, indent=4)
+        print(f"Saved baseline to {args.baseline}")
+    elif args.board in baselines:
+        slowdowns = compare_with_baseline(results, baselines[args.board], args.threshold)
+        for slowdown in slowdowns:
+            print(f"SLOWDOWN {slowdown}")
+        if not slowdowns:
+            print(f"No slowdowns beyond {args.threshold:.0%} of the baseline")
+    else:
+        print(f"No {args.board} baseline in {args.baseline}, run with --save-baseline to record one")
+
+    return 1 if failures or slowdowns else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
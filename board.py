@@ -1,8 +1,10 @@
 import bitboard
 import magicnums
+import magictables
 import ctypes
 import lookuptables
 import copy
+import numpy.typing as npt
 # NOTE:
 # TOP-LEFT is INDEX 0, GOING FROM LEFT TO RIGHT IN A BITBOARD
 # << MOVES TOWARDS THE LEFT
@@ -30,8 +32,8 @@ class Board():
         self.board_area: int
         self.board_width: int
         self.board_height: int
-        self.ROOK_TABLE: list
-        self.BISHOP_TABLE: list
+        self.ROOK_TABLE: npt.NDArray
+        self.BISHOP_TABLE: npt.NDArray
         
         self.en_passantable = []
         
@@ -298,135 +300,8 @@ class Board():
         print("Done!")
             
     def generate_magic_bitboards(self):
-        self.ROOK_TABLE = self.generate_magic_table([(1, 0), (0, 1), (-1, 0), (0, -1)], magicnums.ROOK_SIZE, magicnums.ROOK_MOVES)
-        self.BISHOP_TABLE = self.generate_magic_table([(1, 1), (-1, 1), (1, -1), (-1, -1)], magicnums.BISHOP_SIZE, magicnums.BISHOP_MOVES)
-    
-    def generate_magic_table(self, deltas, table_size, magic_data):
-        
-        # Generate empty table
-        table = [bitboard.Bitboard(0, self.board_width, self.board_height)] * table_size
-
-        for y in range(self.board_height):
-            for x in range(self.board_width):
-                index = y * self.board_width + x
-                magic_data_current = magic_data[index]
-
-                rays = magic_data_current.mask
-                
-                # Loop through all subsets
-                
-                # Emulate do while loop
-                blockers = bitboard.Bitboard(0, self.board_width, self.board_height)
-
-                while True:
-                    possible = self.generate_possible_moves(deltas, blockers, index)
-                    
-                    table[self.generate_magic_index(blockers, magic_data_current.magic, magic_data_current.index_number, magic_data_current.offset)] = possible
-                    blockers.value = (blockers.value - rays) & rays;
-                    
-                    if blockers.value == 0:
-                        break
-        return table
-    
-    def generate_possible_moves(self, deltas, blockers, index):
-        final_bb = bitboard.Bitboard(0, self.board_width, self.board_height)
-        for delta in deltas:
-            ray = 1 << (self.board_area - index - 1)
-            while not (ray & blockers.value):
-                    
-                # Initial border check:
-                if self.border_colliding(ray, delta):
-                    break
-                
-                # Apply operations
-                
-                # Y-delta
-                
-                if delta[0] > 0:
-                    ray = ray >> self.board_width * delta[0]
-                elif delta[0] < 0:
-                    ray = ray << -(self.board_width * delta[0])
-                   
-                # X-delta
-                if delta[1] > 0:
-                    ray = ray >> delta[1]
-                elif delta[1] < 0:
-                    ray = ray << -delta[1]
-
-                
-                # Boundary check
-                if ray <= 0 or ray >= (1 << 64):
-                    break
-                
-                # Update result
-                final_bb.value |= ray
-                
-                # break if touching a blocker
-                if ray & blockers.value:
-                    break
-
-        return final_bb     
-    
-    def border_colliding(self, ray, delta):
-        # Number represents:
-        # 10000000
-        # 10000000
-        # 10000000
-        # 10000000
-        # 10000000
-        # 10000000
-        # 10000000
-        # 10000000
-        LEFT_BORDER = 0x8080808080808080
-        
-        # Number represents:
-        # 00000001
-        # 00000001
-        # 00000001
-        # 00000001
-        # 00000001
-        # 00000001
-        # 00000001
-        # 00000001
-        RIGHT_BORDER = 0x101010101010101
-        
-        # Number represents:
-        # 11111111
-        # 00000000
-        # 00000000
-        # 00000000
-        # 00000000
-        # 00000000
-        # 00000000
-        # 00000000
-        TOP_BORDER = 0xFF00000000000000
-        
-        # Number represents:
-        # 00000000
-        # 00000000
-        # 00000000
-        # 00000000
-        # 00000000
-        # 00000000
-        # 00000000
-        # 11111111
-        BOTTOM_BORDER = 0xFF
-        
-        # Check borders
-        if delta[0] > 0:
-            if ray & BOTTOM_BORDER:
-                return True
-        elif delta[0] < 0:
-            if ray & TOP_BORDER:
-                return True
-            
-        if delta[1] > 0:
-            if ray & RIGHT_BORDER:
-                return True
-        elif delta[1] < 0:
-            if ray & LEFT_BORDER:
-                return True
-        return False
+        # Shared with every other board in the process, see magictables.py
+        self.ROOK_TABLE, self.BISHOP_TABLE = magictables.get_magic_tables()
     
     def generate_magic_index(self, blockers: bitboard.Bitboard, magic_number: int, index_number: int, offset: int) -> int:
         # Index bits are actually directly stored as (64 - their real value) to decrease amount of operations needed
@@ -595,7 +470,7 @@ class Board():
             mask = magicnums.ROOK_MOVES[index].mask
             blockers = bitboard.Bitboard((white_bitboard.value | black_bitboard.value) & mask, self.board_width, self.board_height)
 
-            possible_moves = self.ROOK_TABLE[self.generate_magic_index(blockers, magic_number, index_number, offset)]
+            possible_moves = bitboard.Bitboard(int(self.ROOK_TABLE[self.generate_magic_index(blockers, magic_number, index_number, offset)]), self.board_width, self.board_height)
 
         elif piece_id == self.BISHOP_ID:
             index_number = magicnums.BISHOP_MOVES[index].index_number
@@ -604,7 +479,7 @@ class Board():
             mask = magicnums.BISHOP_MOVES[index].mask
             blockers = bitboard.Bitboard((white_bitboard.value | black_bitboard.value) & mask, self.board_width, self.board_height)
 
-            possible_moves = self.BISHOP_TABLE[self.generate_magic_index(blockers, magic_number, index_number, offset)]
+            possible_moves = bitboard.Bitboard(int(self.BISHOP_TABLE[self.generate_magic_index(blockers, magic_number, index_number, offset)]), self.board_width, self.board_height)
             
         elif piece_id == self.QUEEN_ID:
             # Queen travels in direction of both rook and bishop
@@ -0,0 +1,210 @@
+"""
+Opening book for ChessAI.
+
+compile_book() reads PGN games and EPD positions and writes a book file: a flat array
+of (Zobrist key, move, weight) records sorted by key. One record is kept per position
+and move, weighted by how well the move scored - 2 for a win, 1 for a draw. EPD
+positions contribute their "bm" moves. Keys are newboard's own Zobrist hashes (see
+zobrist.py), so these books are not interchangeable with Polyglot ones.
+
+OpeningBook opens a book with numpy.memmap, so nothing is read up front and only the
+pages a probe touches are loaded - a probe is a binary search over the keys.
+
+Run with: python book.py games.pgn [positions.epd ...] -o book.bin
+"""
+
+import argparse
+import bisect
+import os
+import random
+import re
+import sys
+from array import array
+
+import numpy as np
+
+import epd
+import magictables
+import newboard
+
+RECORD_DTYPE = np.dtype([
+    ("key", "<u8"),
+    ("move", "<u2"),
+    ("weight", "<u2"),
+])
+
+# Only the first DEFAULT_MAX_PLIES plies of every game go into the book
+DEFAULT_MAX_PLIES = 20
+MAX_WEIGHT = 0xFFFF
+
+# Game result -> weight of a move played by (white, black)
+RESULT_WEIGHTS = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1)}
+UNKNOWN_RESULT_WEIGHTS = (1, 1)
+EPD_WEIGHT = 1
+
+HEADER_PATTERN = re.compile(r'\[(\w+)\s+"(.*)"\]')
+# Comments, variation brackets, and everything else split on whitespace
+MOVETEXT_PATTERN = re.compile(r"\{[^}]*\}|;[^\n]*|\(|\)|[^\s(){};]+")
+MOVE_NUMBER_PATTERN = re.compile(r"^\d+\.+")
+
+
+# READING SOURCES
+
+def parse_movetext(movetext: str) -> tuple[list, str]:
+    """Return (SAN moves of the main line, result token or None) from PGN movetext."""
+    moves = []
+    result = None
+    variation_depth = 0
+    for token in MOVETEXT_PATTERN.findall(movetext):
+        if token == "(":
+            variation_depth += 1
+        elif token == ")":
+            variation_depth = max(variation_depth - 1, 0)
+        elif variation_depth or token[0] in "{;$":
+            continue
+        elif token in RESULT_WEIGHTS or token == "*":
+            result = token
+        else:
+            token = MOVE_NUMBER_PATTERN.sub("", token)
+            if token:
+                moves.append(token)
+    return moves, result
+
+def read_pgn(path: str):
+    """Yield (headers, SAN moves, result) for every game in a PGN file, reading one game at a time."""
+    headers = {}
+    movetext = []
+    with open(path, encoding="utf-8", errors="replace") as file:
+        for line in file:
+            stripped = line.strip()
+            match = HEADER_PATTERN.match(stripped)
+            if match:
+                # A header after movetext starts the next game
+                if movetext:
+                    moves, result = parse_movetext("\n".join(movetext))
+                    yield headers, moves, headers.get("Result", result)
+                    headers, movetext = {}, []
+                headers[match.group(1)] = match.group(2)
+            elif stripped:
+                movetext.append(stripped)
+    if movetext:
+        moves, result = parse_movetext("\n".join(movetext))
+        yield headers, moves, headers.get("Result", result)
+
+def pgn_entries(path: str, max_plies: int = DEFAULT_MAX_PLIES):
+    """Yield (key, move, weight) for the first max_plies moves of every game in a PGN file.
+
+    A game is cut short at the first move that can't be read, rather than thrown away."""
+    for headers, moves, result in read_pgn(path):
+        board = newboard.IntBoard.from_fen(headers["FEN"]) if "FEN" in headers else newboard.IntBoard(None, "w")
+        weights = RESULT_WEIGHTS.get(result, UNKNOWN_RESULT_WEIGHTS)
+        for san in moves[:max_plies]:
+            try:
+                move = board.parse_san(san)
+            except Exception:
+                break
+            yield board.hash, int(move), weights[board.side_to_move]
+            board.make_move(move)
+
+def epd_entries(path: str):
+    """Yield (key, move, weight) for every "bm" move in an EPD file."""
+    for encoding, operations in epd.read_epd(path):
+        board = newboard.IntBoard.from_encoding(encoding)
+        for san in operations.get("bm", "").split():
+            try:
+                move = board.parse_san(san)
+            except Exception:
+                continue
+            yield board.hash, int(move), EPD_WEIGHT
+
+
+# COMPILING
+
+def compile_book(sources: list[str], output_path: str, max_plies: int = DEFAULT_MAX_PLIES) -> int:
+    """Compile PGN and EPD files (told apart by extension) into a book file, and return its record count."""
+    # Plain typed arrays rather than a dict of tuples, so millions of entries stay compact
+    keys = array("Q")
+    moves = array("H")
+    weights = array("I")
+    for source in sources:
+        entries = epd_entries(source) if source.lower().endswith(".epd") else pgn_entries(source, max_plies)
+        for key, move, weight in entries:
+            keys.append(key)
+            moves.append(move)
+            weights.append(weight)
+
+    keys = np.frombuffer(keys, dtype=np.uint64)
+    moves = np.frombuffer(moves, dtype=np.uint16)
+    weights = np.frombuffer(weights, dtype=np.uint32).astype(np.int64)
+
+    # Merge repeated (key, move) pairs, summing their weights
+    order = np.lexsort((moves, keys))
+    keys, moves, weights = keys[order], moves[order], weights[order]
+    if len(keys):
+        starts = np.flatnonzero(np.r_[True, (keys[1:] != keys[:-1]) | (moves[1:] != moves[:-1])])
+        keys, moves, weights = keys[starts], moves[starts], np.add.reduceat(weights, starts)
+
+    # Moves that only ever lost would never be picked
+    played = weights > 0
+    keys, moves, weights = keys[played], moves[played], weights[played]
+
+    # By key for the binary search, best moves first within a position
+    order = np.lexsort((-weights, keys))
+    records = np.empty(len(order), dtype=RECORD_DTYPE)
+    records["key"] = keys[order]
+    records["move"] = moves[order]
+    records["weight"] = np.minimum(weights[order], MAX_WEIGHT)
+    # Replaced rather than rewritten, since readers may have the old book mapped (see OpeningBook)
+    magictables.write_file_atomic(output_path, [records.tobytes()])
+    return len(records)
+
+
+# PROBING
+
+class OpeningBook:
+    def __init__(self, path: str):
+        # np.memmap can't map an empty file
+        if os.path.getsize(path) == 0:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+        else:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode="r")
+        # A field view of the mapping, not a copy - np.searchsorted would copy it to make it contiguous,
+        # so probes use bisect, which only touches the log2(n) records it compares against
+        self.keys = self.records["key"]
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def probe(self, key: int) -> list[tuple[int, int]]:
+        """Return [(move, weight), ...] for the position with this key, best first."""
+        # Compare as np.uint64 on both sides, so keys past 2**63 are never rounded through float64
+        key = np.uint64(key)
+        start = bisect.bisect_left(self.keys, key)
+        end = start
+        while end < len(self.keys) and self.keys[end] == key:
+            end += 1
+        return [(int(record["move"]), int(record["weight"])) for record in self.records[start:end]]
+
+    def choose(self, key: int, rng: random.Random = random) -> int:
+        """Return a book move for the position picked at random by weight, or 0 if it isn't in the book."""
+        entries = self.probe(key)
+        if not entries:
+            return 0
+        moves, weights = zip(*entries)
+        return rng.choices(moves, weights)[0]
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sources", nargs="+", help="PGN or EPD files to read")
+    parser.add_argument("-o", "--output", required=True, help="book file to write")
+    parser.add_argument("--plies", type=int, default=DEFAULT_MAX_PLIES, help="plies of each game to read")
+    args = parser.parse_args(argv)
+
+    count = compile_book(args.sources, args.output, args.plies)
+    print(f"Wrote {count} records to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
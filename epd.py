@@ -0,0 +1,106 @@
+"""
+Streaming EPD reader for newboard.
+
+read_epd() yields one position per line and never holds more than a line in memory,
+so multi-million line files can be walked without loading them. read_epd_batches()
+decodes straight into NumPy arrays that are allocated once and refilled for every
+batch, for work that runs over many positions at a time.
+
+Lines holding a full FEN (with the two move counters) are read as well.
+"""
+
+import numpy as np
+import numpy.typing as npt
+
+import newboard
+
+# Columns of the bitboard array - the 2 side bitboards then the 6 piece bitboards, as in Board.encode_position()
+BITBOARD_COLUMNS = 8
+# Columns of the state array - side to move, castling rights, en passant square, halfmove clock
+STATE_COLUMNS = 4
+
+
+def parse_operations(text: str) -> dict:
+    """Split EPD operations ('bm e4; id "pos 1";') into {opcode: operand string}, with quotes removed."""
+    operations = {}
+    operation = ""
+    quoted = False
+    for character in text + ";":
+        if character == '"':
+            quoted = not quoted
+        if character == ";" and not quoted:
+            opcode, _, operand = operation.strip().partition(" ")
+            if opcode:
+                operand = operand.strip()
+                if len(operand) >= 2 and operand[0] == operand[-1] == '"':
+                    operand = operand[1:-1]
+                operations[opcode] = operand
+            operation = ""
+        else:
+            operation += character
+    return operations
+
+def parse_epd(line: str) -> tuple[tuple, dict]:
+    """Return (Board.encode_position() tuple, operations) for one EPD line."""
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise Exception(f"Invalid EPD, expected at least 4 fields: {line!r}")
+
+    rest = fields[4] if len(fields) > 4 else ""
+    counters = rest.split(None, 2)
+    if len(counters) >= 2 and counters[0].isdigit() and counters[1].isdigit():
+        # A plain FEN line, the move counters take the place of the operations
+        encoding, _ = newboard.parse_fen(line)
+        return encoding, parse_operations(counters[2] if len(counters) > 2 else "")
+
+    operations = parse_operations(rest)
+    encoding, _ = newboard.parse_fen(" ".join(fields[:4]))
+    if "hmvc" in operations:
+        encoding = encoding[:11] + (int(operations["hmvc"]),)
+    return encoding, operations
+
+def read_epd(path: str):
+    """Yield (Board.encode_position() tuple, operations) for every position in the file."""
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield parse_epd(line)
+
+def read_epd_into(positions, bitboards: npt.NDArray[np.uint64], state: npt.NDArray = None) -> int:
+    """Decode positions from an iterator of EPD lines into preallocated (N, 8) bitboard and (N, 4) state arrays.
+
+    Stops when the arrays are full or the lines run out, and returns the number of rows written."""
+    count = 0
+    capacity = len(bitboards)
+    if capacity == 0:
+        return 0
+    for line in positions:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        encoding, _ = parse_epd(line)
+        bitboards[count] = encoding[:BITBOARD_COLUMNS]
+        if state is not None:
+            state[count] = encoding[BITBOARD_COLUMNS:]
+        count += 1
+        # Check after writing, so no line is taken from the iterator and then dropped
+        if count == capacity:
+            break
+    return count
+
+def read_epd_batches(path: str, batch_size: int = 65536):
+    """Yield (bitboards, state) arrays of up to batch_size positions each.
+
+    The same two arrays are refilled for every batch, so copy a batch before asking
+    for the next one if it needs to be kept."""
+    bitboards = np.zeros((batch_size, BITBOARD_COLUMNS), dtype=np.uint64)
+    state = np.zeros((batch_size, STATE_COLUMNS), dtype=np.int16)
+    with open(path) as file:
+        while True:
+            count = read_epd_into(file, bitboards, state)
+            if count == 0:
+                break
+            yield bitboards[:count], state[:count]
+            if count < batch_size:
+                break
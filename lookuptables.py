@@ -43,8 +43,9 @@ KING_TABLE.reverse()
 
 # mg = middlegame, eg = endgame
 
-MG_VALUES = [82, 337, 365, 477, 1025,  0]
-EG_VALUES = [94, 281, 297, 512,  936,  0]
+# Indexed by piece id (pawn, bishop, rook, knight, queen, king), not PeSTO's own piece order
+MG_VALUES = [82, 365, 477, 337, 1025,  0]
+EG_VALUES = [94, 297, 512, 281,  936,  0]
 
 MG_PAWN = [ 
     [0, 0, 0, 0, 0, 0, 0, 0],
@@ -397,4 +398,59 @@ for id in range(6):
             BLACK_EG_TABLE[id][row][piece] = EG_TABLE[id][black_row][black_piece] + EG_VALUES[id]
 
             
-GAMEPHASE_INC = [0,1,1,2,4,0]
\ No newline at end of file
+GAMEPHASE_INC = [0,1,2,1,4,0]
+
+# The tables above flattened and indexed by [side][piece id][bit position], where row = 7 - bit // 8
+# and column = 7 - bit % 8. Black's scores are negated, so summing every piece on the board gives
+# the score from white's point of view.
+MG_SQUARE_SCORES = [[[0] * 64 for _ in range(6)] for _ in range(2)]
+EG_SQUARE_SCORES = [[[0] * 64 for _ in range(6)] for _ in range(2)]
+
+for id in range(6):
+    for position in range(64):
+        row = 7 - position // 8
+        column = 7 - position % 8
+        MG_SQUARE_SCORES[0][id][position] = WHITE_MG_TABLE[id][row][column]
+        EG_SQUARE_SCORES[0][id][position] = WHITE_EG_TABLE[id][row][column]
+        MG_SQUARE_SCORES[1][id][position] = -BLACK_MG_TABLE[id][row][column]
+        EG_SQUARE_SCORES[1][id][position] = -BLACK_EG_TABLE[id][row][column]
+
+
+# Pawn attack tables, indexed by bit position (bit 0 is the bottom right square, << moves left)
+WHITE_PAWN_ATTACKS = [0] * 64
+BLACK_PAWN_ATTACKS = [0] * 64
+
+for position in range(64):
+    column = position % 8
+    row = position // 8
+    if row < 7:
+        if column < 7:
+            WHITE_PAWN_ATTACKS[position] |= 1 << (position + 9)
+        if column > 0:
+            WHITE_PAWN_ATTACKS[position] |= 1 << (position + 7)
+    if row > 0:
+        if column < 7:
+            BLACK_PAWN_ATTACKS[position] |= 1 << (position - 7)
+        if column > 0:
+            BLACK_PAWN_ATTACKS[position] |= 1 << (position - 9)
+
+# Empty board rook and bishop rays, and the squares strictly between two squares on the same line (0 if they aren't on one)
+ROOK_RAYS = [0] * 64
+BISHOP_RAYS = [0] * 64
+BETWEEN_TABLE = [[0] * 64 for _ in range(64)]
+
+for position in range(64):
+    for dx, dy in [(1, 0), (0, 1), (-1, 0), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1)]:
+        column = position % 8 + dx
+        row = position // 8 + dy
+        between = 0
+        while 0 <= column < 8 and 0 <= row < 8:
+            target = row * 8 + column
+            if dx == 0 or dy == 0:
+                ROOK_RAYS[position] |= 1 << target
+            else:
+                BISHOP_RAYS[position] |= 1 << target
+            BETWEEN_TABLE[position][target] = between
+            between |= 1 << target
+            column += dx
+            row += dy
@@ -0,0 +1,184 @@
+"""
+Rook and bishop attack tables for the magic bitboard lookup.
+
+Building the tables walks every blocker subset of every square, which is far too
+slow to do each time a board is created. The tables are therefore built once,
+written to a versioned cache file keyed by a hash of the magic numbers, and
+loaded back with numpy.memmap so that every process maps the same pages.
+
+Boards should use get_magic_tables(), which loads the tables lazily on first
+use and hands the same read-only arrays to every board in the process.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+
+import numpy as np
+import numpy.typing as npt
+
+import magicnums
+
+# Bump whenever the layout of the cache file or the way rays are generated changes
+CACHE_VERSION = 1
+CACHE_DIR = os.environ.get("MAGIC_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".magic_cache"))
+
+ROOK_DELTAS = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+BISHOP_DELTAS = [(1, 1), (-1, 1), (1, -1), (-1, -1)]
+
+BOARD_WIDTH = 8
+BOARD_AREA = 64
+FULL_BITBOARD = 0xFFFFFFFFFFFFFFFF
+
+# (mask, magic, index_number, offset) for each square, indexed by bit position.
+# magicnums stores its squares reversed, so entry i belongs to bit (63 - i)
+ROOK_MAGICS = [(data.mask, data.magic, data.index_number, data.offset) for data in reversed(magicnums.ROOK_MOVES)]
+BISHOP_MAGICS = [(data.mask, data.magic, data.index_number, data.offset) for data in reversed(magicnums.BISHOP_MOVES)]
+
+# Process-wide registry, filled in by get_magic_tables() and get_magic_lists()
+_tables = None
+_lists = None
+_tables_lock = threading.Lock()
+
+
+# KEYING
+
+def magic_hash() -> str:
+    """Return a hash of everything the contents of the tables depend on."""
+    digest = hashlib.sha256()
+    digest.update(f"v{CACHE_VERSION};{magicnums.ROOK_SIZE};{magicnums.BISHOP_SIZE};".encode())
+    for data in magicnums.ROOK_MOVES + magicnums.BISHOP_MOVES:
+        digest.update(f"{data.mask:x},{data.magic:x},{data.index_number},{data.offset};".encode())
+    return digest.hexdigest()
+
+def cache_path(cache_dir: str = None) -> str:
+    if cache_dir is None:
+        cache_dir = CACHE_DIR
+    return os.path.join(cache_dir, f"magic_v{CACHE_VERSION}_{magic_hash()[:16]}.bin")
+
+
+# GENERATION
+
+def magic_index(blockers: int, magic_number: int, index_number: int, offset: int) -> int:
+    # Index bits are stored as (64 - their real value), so the shift keeps only the top bits
+    return (((blockers * magic_number) & FULL_BITBOARD) >> index_number) + offset
+
+def generate_piece_rays(deltas: list[tuple[int, int]], blockers: int, position: int) -> int:
+    """Return the squares a slider on position can see, stopping at (and including) the first blocker in each direction."""
+    final = 0
+    for dx, dy in deltas:
+        x = position % BOARD_WIDTH + dx
+        y = position // BOARD_WIDTH + dy
+        while 0 <= x < BOARD_WIDTH and 0 <= y < BOARD_WIDTH:
+            ray = 1 << (y * BOARD_WIDTH + x)
+            final |= ray
+            if ray & blockers:
+                break
+            x += dx
+            y += dy
+    return final
+
+def generate_magic_table(deltas: list[tuple[int, int]], size: int, data: list[magicnums.MagicData]) -> npt.NDArray[np.uint64]:
+    table = np.zeros(size, dtype=np.uint64)
+
+    # magicnums stores its squares reversed, so entry i belongs to bit (63 - i)
+    for index, magic_data in enumerate(data):
+        position = BOARD_AREA - 1 - index
+        rays = magic_data.mask
+
+        # Loop through all subsets of the mask (Carry-Rippler)
+        blockers = 0
+        while True:
+            table[magic_index(blockers, magic_data.magic, magic_data.index_number, magic_data.offset)] = generate_piece_rays(deltas, blockers, position)
+            blockers = (blockers - rays) & rays
+
+            if blockers == 0:
+                break
+
+    return table
+
+def build_magic_tables() -> tuple[npt.NDArray[np.uint64], npt.NDArray[np.uint64]]:
+    rook_table = generate_magic_table(ROOK_DELTAS, magicnums.ROOK_SIZE, magicnums.ROOK_MOVES)
+    bishop_table = generate_magic_table(BISHOP_DELTAS, magicnums.BISHOP_SIZE, magicnums.BISHOP_MOVES)
+    return rook_table, bishop_table
+
+
+# CACHING
+
+def write_file_atomic(path: str, chunks: list[bytes]):
+    """Write chunks to path atomically, so a concurrent reader never sees a half-written file.
+
+    Caches are shared between users, so the file is made world readable - mkstemp creates it 0600."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            for chunk in chunks:
+                file.write(chunk)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def write_magic_tables(path: str, rook_table: npt.NDArray[np.uint64], bishop_table: npt.NDArray[np.uint64]):
+    write_file_atomic(path, [rook_table.astype("<u8").tobytes(), bishop_table.astype("<u8").tobytes()])
+
+def built_tables(rook_table: npt.NDArray[np.uint64], bishop_table: npt.NDArray[np.uint64]) -> tuple[npt.NDArray[np.uint64], npt.NDArray[np.uint64]]:
+    rook_table.flags.writeable = False
+    bishop_table.flags.writeable = False
+    return rook_table, bishop_table
+
+def load_magic_tables(cache_dir: str = None) -> tuple[npt.NDArray[np.uint64], npt.NDArray[np.uint64]]:
+    """Return (rook_table, bishop_table), building and caching them on disk if needed.
+
+    The returned arrays are read-only views into a memory-mapped file."""
+    path = cache_path(cache_dir)
+    total_size = magicnums.ROOK_SIZE + magicnums.BISHOP_SIZE
+
+    if not os.path.exists(path) or os.path.getsize(path) != total_size * 8:
+        rook_table, bishop_table = build_magic_tables()
+        try:
+            write_magic_tables(path, rook_table, bishop_table)
+        except OSError:
+            # Read-only checkout - fall back to the tables we just built
+            return built_tables(rook_table, bishop_table)
+
+    try:
+        tables = np.memmap(path, dtype="<u8", mode="r", shape=(total_size,))
+    except OSError:
+        # A cache file we aren't allowed to read, e.g. left by another user - build the tables in memory
+        return built_tables(*build_magic_tables())
+    return tables[:magicnums.ROOK_SIZE], tables[magicnums.ROOK_SIZE:]
+
+
+# REGISTRY
+
+def get_magic_tables() -> tuple[npt.NDArray[np.uint64], npt.NDArray[np.uint64]]:
+    """Return the shared, read-only (rook_table, bishop_table), loading them on first use."""
+    global _tables
+    if _tables is None:
+        with _tables_lock:
+            if _tables is None:
+                _tables = load_magic_tables()
+    return _tables
+
+def get_magic_lists() -> tuple[list[int], list[int]]:
+    """Return the shared tables as lists of plain ints, for boards that keep their bitboards as ints."""
+    global _lists
+    if _lists is None:
+        rook_table, bishop_table = get_magic_tables()
+        with _tables_lock:
+            if _lists is None:
+                _lists = (rook_table.tolist(), bishop_table.tolist())
+    return _lists
+
+
+if __name__ == "__main__":
+    import time
+
+    start = time.perf_counter()
+    rook, bishop = get_magic_tables()
+    print(f"Loaded {len(rook)} rook and {len(bishop)} bishop entries from {cache_path()} in {time.perf_counter() - start:.3f}s")
@@ -1,8 +1,18 @@
-import magicnums
+import magictables
 import lookuptables
+import zobrist
+import transposition
+import pawnhash
+import timemanager
 import numpy as np
 import numpy.typing as npt
+from array import array
+from dataclasses import dataclass
+import concurrent.futures
+import multiprocessing
 import queue
+import itertools
+import time
 from gmpy2 import bit_scan1
 
 # NOTE:
@@ -46,14 +56,17 @@ class Board:
     
     LEFT_BORDER = 0x8080808080808080
     RIGHT_BORDER = 0x101010101010101
+    NOT_LEFT_BORDER = 0x7F7F7F7F7F7F7F7F
+    NOT_RIGHT_BORDER = 0xFEFEFEFEFEFEFEFE
+    NOT_LEFT_TWO_FILES = 0x3F3F3F3F3F3F3F3F
+    NOT_RIGHT_TWO_FILES = 0xFCFCFCFCFCFCFCFC
     
-    # Kings/Rooks moved detection constants for castling
-    CASTLE_BLACK_SHORT_ROOK = 0
-    CASTLE_BLACK_LONG_ROOK = 1
-    CASTLE_BLACK_KING = 2
-    CASTLE_WHITE_SHORT_ROOK = 3
-    CASTLE_WHITE_LONG_ROOK = 4
-    CASTLE_WHITE_KING = 5
+    # Castling rights, packed as bits of a single int
+    CASTLE_WHITE_SHORT = 0b0001
+    CASTLE_WHITE_LONG = 0b0010
+    CASTLE_BLACK_SHORT = 0b0100
+    CASTLE_BLACK_LONG = 0b1000
+    ALL_CASTLING_RIGHTS = 0b1111
     
     # Move encoding ids
     QUIET_MOVE = 0
@@ -73,14 +86,76 @@ class Board:
     
     NULL_POSITION = 65
     
+    # Mailbox squares hold (side << MAILBOX_SIDE_SHIFT) | piece_id, or EMPTY_ID
+    MAILBOX_SIDE_SHIFT = 3
+    MAILBOX_PIECE_MASK = 0b111
+    
+    # Rook square -> (king destination, rook destination) when castling with that rook
+    CASTLING_SQUARES = {0: (1, 2), 7: (5, 4), 56: (57, 58), 63: (61, 60)}
+    # Castling rights kept after a move from or to each square - moving a king or rook, or taking a rook, loses them
+    CASTLING_RIGHTS_KEPT = [ALL_CASTLING_RIGHTS] * 64
+    CASTLING_RIGHTS_KEPT[0] ^= CASTLE_WHITE_SHORT
+    CASTLING_RIGHTS_KEPT[7] ^= CASTLE_WHITE_LONG
+    CASTLING_RIGHTS_KEPT[3] ^= CASTLE_WHITE_SHORT | CASTLE_WHITE_LONG
+    CASTLING_RIGHTS_KEPT[56] ^= CASTLE_BLACK_SHORT
+    CASTLING_RIGHTS_KEPT[63] ^= CASTLE_BLACK_LONG
+    CASTLING_RIGHTS_KEPT[59] ^= CASTLE_BLACK_SHORT | CASTLE_BLACK_LONG
+    
+    # Undo records pack everything make_move can't work backwards from into one int:
+    # castling rights | en passant square << 4 | captured piece id << 11 | halfmove clock << 14
+    UNDO_EP_SHIFT = 4
+    UNDO_CAPTURED_SHIFT = 11
+    UNDO_HALFMOVE_SHIFT = 14
+    UNDO_STACK_SIZE = 1024
+    
+    CAPTURE_FLAGS = [CAPTURE, KNIGHT_PROMOTION_CAPTURE, BISHOP_PROMOTION_CAPTURE, ROOK_PROMOTION_CAPTURE, QUEEN_PROMOTION_CAPTURE]
+    # Promotion flag -> piece id the pawn turns into
+    PROMOTION_FLAGS = {
+        KNIGHT_PROMOTION: KNIGHT_ID, KNIGHT_PROMOTION_CAPTURE: KNIGHT_ID,
+        BISHOP_PROMOTION: BISHOP_ID, BISHOP_PROMOTION_CAPTURE: BISHOP_ID,
+        ROOK_PROMOTION: ROOK_ID, ROOK_PROMOTION_CAPTURE: ROOK_ID,
+        QUEEN_PROMOTION: QUEEN_ID, QUEEN_PROMOTION_CAPTURE: QUEEN_ID,
+    }
+    
+    # Bitboard arithmetic backend - every bitboard this class touches is a np.uint64.
+    # IntBoard swaps these for plain Python ints.
+    ONE = np.uint64(1)
+    ZERO = np.uint64(0)
+    FULL_BITBOARD = 0xFFFFFFFFFFFFFFFF
+    
+    # lookuptables stores these top left first, so flip them to be indexed by bit position
+    KNIGHT_TABLE = np.array(lookuptables.KNIGHT_TABLE[::-1], dtype=np.uint64)
+    KING_TABLE = np.array(lookuptables.KING_TABLE[::-1], dtype=np.uint64)
+    PAWN_ATTACK_TABLE = np.array([lookuptables.WHITE_PAWN_ATTACKS, lookuptables.BLACK_PAWN_ATTACKS], dtype=np.uint64)
+    ROOK_RAYS = np.array(lookuptables.ROOK_RAYS, dtype=np.uint64)
+    BISHOP_RAYS = np.array(lookuptables.BISHOP_RAYS, dtype=np.uint64)
+    BETWEEN_TABLE = np.array(lookuptables.BETWEEN_TABLE, dtype=np.uint64)
+    
+    # Material values for static exchange evaluation, and the order attackers are tried in (least valuable first)
+    SEE_VALUES = [100, 330, 500, 320, 900, 20000]
+    SEE_ORDER = [PAWN_ID, KNIGHT_ID, BISHOP_ID, ROOK_ID, QUEEN_ID, KING_ID]
+    
+    # Square and piece names for move notation - bit 0 is h1, so files count down from the right
+    FILE_NAMES = "hgfedcba"
+    PIECE_LETTERS = "pbrnqk"
+    CASTLING_LETTERS = {CASTLE_WHITE_SHORT: "K", CASTLE_WHITE_LONG: "Q", CASTLE_BLACK_SHORT: "k", CASTLE_BLACK_LONG: "q"}
+    
+    # PeSTO evaluation - per square scores summed from white's point of view, and the game phase weight of each piece
+    MG_SQUARE_SCORES = lookuptables.MG_SQUARE_SCORES
+    EG_SQUARE_SCORES = lookuptables.EG_SQUARE_SCORES
+    GAMEPHASE_INC = lookuptables.GAMEPHASE_INC
+    MAX_GAME_PHASE = 24
+    
     WHITE_ICONS = [u'♟', u'♝', u'♜', u'♞', u'♛', u'♚']
     BLACK_ICONS = [u'♙', u'♗', u'♖', u'♘', u'♕', u'♔']
     EMPTY_ICON = u'.'
     
-    def __init__(self, game, side):
+    def __init__(self, game, side, encoding: tuple = None):
+        """Set up the starting position, or the one in encoding (see encode_position) if given."""
         self.game = game
         self.side = side
         
+        # Shared by every board in the process, not copied
         self.ROOK_TABLE: npt.NDArray
         self.BISHOP_TABLE: npt.NDArray
         self.ROOK_TABLE, self.BISHOP_TABLE = self.setup_magic_tables()
@@ -89,19 +164,37 @@ class Board:
         self.piece_bitboards: npt.NDArray
         
         self.side_bitboards, self.piece_bitboards = self.setup_bitboards()
+        self.side_to_move = self.WHITE_SIDE
         
-        self.castle_bools_queue = queue.LifoQueue()
-        self.castle_bools_queue.put(np.full(6, True))
+        # Irreversible state, saved on the undo stack by make_move
+        self.castling_rights = self.ALL_CASTLING_RIGHTS
+        self.en_passant_square = self.NULL_POSITION
+        self.halfmove_clock = 0
         
-        self.move_history = []
+        # Squares each side attacks, worked out on first use in a position (see attacked_squares).
+        # make_move saves them on attack_stack, two slots per ply, and clears them in place so nothing is
+        # allocated per move; unmake_move copies them back.
+        self.attack_maps = [None, None]
+        self.attack_stack = [None] * (2 * self.UNDO_STACK_SIZE)
+        
+        self.undo_stack = array("L", [0]) * self.UNDO_STACK_SIZE
+        self.hash_stack = array("Q", [0]) * self.UNDO_STACK_SIZE
+        self.pawn_hash_stack = array("Q", [0]) * self.UNDO_STACK_SIZE
+        
+        # With these set, every make/unmake checks the incremental hashes and evaluation against a full recomputation
+        self.debug_hash = False
+        self.debug_eval = False
+        
+        # Everything derived from the position is worked out once, here, rather than for the starting
+        # position first and again for the one asked for
+        self.load_position(encoding if encoding is not None else self.encode_position())
     
     
     # SETUP
     
     def setup_magic_tables(self):
-        rook_table = self.generate_magic_table([(1, 0), (0, 1), (-1, 0), (0, -1)], magicnums.ROOK_SIZE, magicnums.ROOK_MOVES)
-        bishop_table = self.generate_magic_table([(1, 1), (-1, 1), (1, -1), (-1, -1)], magicnums.BISHOP_SIZE, magicnums.BISHOP_MOVES)
-        return rook_table, bishop_table
+        # Built once, cached on disk and shared process-wide, see magictables.py
+        return magictables.get_magic_tables()
     
     def setup_bitboards(self):
         side_bitboards = np.array([np.uint64(0)] * 2)
@@ -116,44 +209,102 @@ class Board:
         piece_bitboards[self.PAWN_ID] = 0b0000000011111111000000000000000000000000000000001111111100000000
         return side_bitboards, piece_bitboards
     
+    def setup_mailbox(self) -> bytearray:
+        mailbox = bytearray([self.EMPTY_ID] * self.BOARD_AREA)
+        for position in range(self.BOARD_AREA):
+            positionBB = self.ONE << position
+            for side, side_bb in enumerate(self.side_bitboards):
+                if not (positionBB & side_bb):
+                    continue
+                for piece_id, piece_bb in enumerate(self.piece_bitboards):
+                    if positionBB & piece_bb:
+                        mailbox[position] = (side << self.MAILBOX_SIDE_SHIFT) | piece_id
+        return mailbox
+    
+    # POSITION ENCODING
+    
+    def encode_position(self) -> tuple:
+        """Return the position as a flat tuple of ints, cheap to pickle and send to another process.
+        
+        Holds the 2 side bitboards, the 6 piece bitboards, then side to move, castling rights,
+        en passant square and halfmove clock. Move history is not included."""
+        return (tuple(int(bb) for bb in self.side_bitboards) + tuple(int(bb) for bb in self.piece_bitboards)
+                + (self.side_to_move, self.castling_rights, self.en_passant_square, self.halfmove_clock))
+    
+    def load_position(self, encoding: tuple):
+        """Set up the position from encode_position()'s output, clearing the move history."""
+        self.side_bitboards[:] = encoding[0:2]
+        self.piece_bitboards[:] = encoding[2:8]
+        self.side_to_move, self.castling_rights, self.en_passant_square, self.halfmove_clock = encoding[8:12]
+        # Square-indexed copy of the bitboards, so finding the piece on a square is a single lookup
+        self.mailbox = self.setup_mailbox()
+        self.attack_maps[0] = self.attack_maps[1] = None
+        self.ply = 0
+        # Plies played in the game before this board was set up, for the FEN fullmove number
+        self.start_game_ply = self.side_to_move
+        self.move_history = []
+        # Zobrist keys of the position and of the pawns alone (for the pawn hash table), and the PeSTO
+        # middlegame/endgame scores (white's point of view) and game phase - all kept up to date by make_move
+        self.hash = self.compute_hash()
+        self.pawn_hash = self.compute_pawn_hash()
+        self.mg_score, self.eg_score, self.game_phase = self.compute_evaluation()
+    
+    @classmethod
+    def from_encoding(cls, encoding: tuple, game = None, side = "w"):
+        return cls(game, side, encoding)
+    
+    def load_fen(self, fen: str):
+        encoding, fullmove_number = parse_fen(fen)
+        self.load_position(encoding)
+        self.start_game_ply = 2 * (fullmove_number - 1) + self.side_to_move
+    
+    @classmethod
+    def from_fen(cls, fen: str, game = None, side = "w"):
+        encoding, fullmove_number = parse_fen(fen)
+        board = cls(game, side, encoding)
+        board.start_game_ply = 2 * (fullmove_number - 1) + board.side_to_move
+        return board
+    
+    def to_fen(self) -> str:
+        rows = []
+        for rank in reversed(range(self.BOARD_HEIGHT)):
+            row = ""
+            empty = 0
+            # Files run a to h, which is from the top bit of the rank down
+            for column in reversed(range(self.BOARD_WIDTH)):
+                square = self.mailbox[rank * self.BOARD_WIDTH + column]
+                if square == self.EMPTY_ID:
+                    empty += 1
+                    continue
+                if empty:
+                    row += str(empty)
+                    empty = 0
+                letter = self.PIECE_LETTERS[square & self.MAILBOX_PIECE_MASK]
+                row += letter.upper() if square >> self.MAILBOX_SIDE_SHIFT == self.WHITE_SIDE else letter
+            if empty:
+                row += str(empty)
+            rows.append(row)
+        
+        castling = "".join(letter for right, letter in self.CASTLING_LETTERS.items() if self.castling_rights & right) or "-"
+        en_passant = self.square_name(self.en_passant_square) if self.en_passant_square != self.NULL_POSITION else "-"
+        fullmove_number = (self.start_game_ply + self.ply) // 2 + 1
+        return f"{'/'.join(rows)} {'wb'[self.side_to_move]} {castling} {en_passant} {self.halfmove_clock} {fullmove_number}"
+    
     # WIN CONDITIONS
     
     def in_check(self, side: int) -> bool:
-        white_bitboard = self.side_bitboards[self.WHITE_SIDE]
-        black_bitboard = self.side_bitboards[self.BLACK_SIDE]
-        if side == self.WHITE_SIDE:
-            kingBB = self.piece_bitboards[self.KING_ID] & white_bitboard
-
-            # Go through all black pieces
-            ROOK_ATTACKERS = self.generate_sliding_moves(kingBB, white_bitboard, black_bitboard, self.ROOK_ID, True)
-            BISHOP_ATTACKERS = self.generate_sliding_moves(kingBB, white_bitboard, black_bitboard, self.BISHOP_ID, True)
-            # We do not need to generate queen - just do a bitwise OR
-            PAWN_ATTACKERS = self.generate_pawn_moves(kingBB, white_bitboard, black_bitboard, self.move_history, True)
-            KNIGHT_ATTACKERS = self.generate_knight_moves(kingBB, white_bitboard, black_bitboard, True)
-            KING_ATTACKERS = self.generate_king_moves(kingBB, white_bitboard, black_bitboard, True)
-            
-            if ((ROOK_ATTACKERS & (black_bitboard & self.piece_bitboards[self.ROOK_ID])) | (BISHOP_ATTACKERS & (black_bitboard & self.piece_bitboards[self.BISHOP_ID])) | (PAWN_ATTACKERS & (black_bitboard & self.piece_bitboards[self.PAWN_ID])) | (KNIGHT_ATTACKERS & (black_bitboard & self.piece_bitboards[self.KNIGHT_ID])) | (KING_ATTACKERS & (black_bitboard & self.piece_bitboards[self.KING_ID]))):
-                return True
-            return False
-        elif side == self.BLACK_SIDE:
-            kingBB = self.piece_bitboards[self.KING_ID] & black_bitboard
-            
-            # Go through all white pieces
-            ROOK_ATTACKERS = self.generate_sliding_moves(kingBB, white_bitboard, black_bitboard, self.ROOK_ID, True)
-            BISHOP_ATTACKERS = self.generate_sliding_moves(kingBB, white_bitboard, black_bitboard, self.BISHOP_ID, True)
-            # We do not need to generate queen - just do a bitwise OR
-            PAWN_ATTACKERS = self.generate_pawn_moves(kingBB, white_bitboard, black_bitboard, self.move_history, True)
-            KNIGHT_ATTACKERS = self.generate_knight_moves(kingBB, white_bitboard, black_bitboard, True)
-            KING_ATTACKERS = self.generate_king_moves(kingBB, white_bitboard, black_bitboard, True)
-            
-            if ((ROOK_ATTACKERS & (white_bitboard & self.piece_bitboards[self.ROOK_ID])) | (BISHOP_ATTACKERS & (white_bitboard & self.piece_bitboards[self.BISHOP_ID])) | (PAWN_ATTACKERS & (white_bitboard & self.piece_bitboards[self.PAWN_ID])) | (KNIGHT_ATTACKERS & (white_bitboard & self.piece_bitboards[self.KNIGHT_ID])) | (KING_ATTACKERS & (white_bitboard & self.piece_bitboards[self.KING_ID]))):
-                return True
-            return False
-        else:
+        if side not in [self.WHITE_SIDE, self.BLACK_SIDE]:
             raise Exception("Invalid side!")
+        
+        kingBB = self.piece_bitboards[self.KING_ID] & self.side_bitboards[side]
+        if self.attacked_squares(1 - side) & kingBB:
+            return True
+        return False
             
-    def check_condition(self, side: int) -> str:
-        if len(self.generate_legal_moves()[side]) == 0:
+    def check_condition(self, side: int = None) -> str:
+        if side is None:
+            side = self.side_to_move
+        if len(self.generate_legal_moves(side)) == 0:
             if self.in_check(side):
                 return "c"
             else:
@@ -164,500 +315,866 @@ class Board:
     
     # MOVE GENERATION
     
-    def generate_legal_moves(self):
-        white_moves = []
-        black_moves = []
-        # Make a bitboard of the current board to loop through
-        white_bitboard = self.side_bitboards[self.WHITE_SIDE]
-        black_bitboard = self.side_bitboards[self.BLACK_SIDE]
-        current_board = white_bitboard | black_bitboard
-        while current_board != 0:
-            current_position = np.uint64(1) << self.return_lsb_position(current_board)
-            if (self.piece_bitboards[self.ROOK_ID] & (current_position)):
-                possible_moves = self.generate_sliding_moves(current_position, white_bitboard, black_bitboard, self.ROOK_ID)
-            elif (self.piece_bitboards[self.BISHOP_ID] & (current_position)):
-                possible_moves = self.generate_sliding_moves(current_position, white_bitboard, black_bitboard, self.BISHOP_ID)
-            elif (self.piece_bitboards[self.QUEEN_ID] & (current_position)):
-                possible_moves = self.generate_sliding_moves(current_position, white_bitboard, black_bitboard, self.QUEEN_ID)
-            elif (self.piece_bitboards[self.PAWN_ID] & (current_position)):
-                possible_moves = self.generate_pawn_moves(current_position, white_bitboard, black_bitboard, self.move_history)
-            elif (self.piece_bitboards[self.KNIGHT_ID] & (current_position)):
-                possible_moves = self.generate_knight_moves(current_position, white_bitboard, black_bitboard)
-            elif (self.piece_bitboards[self.KING_ID] & (current_position)):
-                possible_moves = self.generate_king_moves(current_position, white_bitboard, black_bitboard)
-            
-            side = self.WHITE_SIDE if current_position & white_bitboard else self.BLACK_SIDE
-            for move in possible_moves:
-                self.make_move(move)
-                if not self.in_check(side):
-                    if side == self.WHITE_SIDE:
-                        white_moves.append(move)
-                    elif side == self.BLACK_SIDE:
-                        black_moves.append(move)
-                self.unmake_move(self.move_history)
-            
-            current_board ^= current_position
-        return white_moves, black_moves
-    
-    def generate_pawn_moves(self, current_position: np.uint64, white_bitboard: np.uint64, black_bitboard: np.uint64, move_history: list, return_bb = False):
+    def generate_legal_moves(self, side: int = None, captures_only: bool = False) -> list:
+        """Generate every legal move for side, which defaults to the side to move.
+        
+        Checkers, pinned pieces and the squares that block or capture a checker are worked
+        out once for the position, so only en passant has to be tried out on the board.
+        With captures_only, only captures and promotions are generated."""
+        if side is None:
+            side = self.side_to_move
         moves = []
-        bb = np.uint64(0)
-        if (current_position & white_bitboard):
-            # Normal pushes & promotions
-            pushed = ((current_position << self.BOARD_WIDTH) | self.FIRST_RANK) ^ self.FIRST_RANK
-            if not (pushed & white_bitboard) and not (pushed & black_bitboard):
-                if not (pushed & self.EIGTH_RANK):
-                    moves.append(self.encode_move(self.QUIET_MOVE, current_position, pushed))
+        own_bitboard = self.side_bitboards[side]
+        enemy_bitboard = self.side_bitboards[1 - side]
+        occupied = own_bitboard | enemy_bitboard
+        not_own = enemy_bitboard if captures_only else own_bitboard ^ self.FULL_BITBOARD
+        
+        kingBB = self.piece_bitboards[self.KING_ID] & own_bitboard
+        if not kingBB:
+            return moves
+        king_index = self.return_lsb_position(kingBB)
+        # The enemy's attacks are worked out with our king off the board, so it can't hide behind itself from a slider
+        enemy_attacks = self.attacked_squares(1 - side)
+        checkers = self.attackers_to(king_index, occupied) & enemy_bitboard if enemy_attacks & kingBB else self.ZERO
+        
+        targets = self.KING_TABLE[king_index] & not_own & (enemy_attacks ^ self.FULL_BITBOARD)
+        while targets != 0:
+            target = self.return_lsb_position(targets)
+            targetBB = self.ONE << target
+            moves.append(self.encode_move(self.CAPTURE if targetBB & enemy_bitboard else self.QUIET_MOVE, king_index, target))
+            targets ^= targetBB
+        
+        # Double check - only the king can move
+        if checkers and checkers & (checkers - self.ONE):
+            return moves
+        
+        # Every other move has to land on check_mask: anywhere when not in check, otherwise on the checker or in its way
+        if checkers:
+            check_mask = self.BETWEEN_TABLE[king_index][self.return_lsb_position(checkers)] | checkers
+        else:
+            check_mask = self.FULL_BITBOARD
+            if not captures_only:
+                moves += self.generate_castling_moves(side, king_index, occupied, enemy_bitboard)
+        
+        pin_rays = self.find_pins(king_index, own_bitboard, enemy_bitboard, occupied)
+        
+        # Knights - a pinned knight can never move
+        pieces = own_bitboard & self.piece_bitboards[self.KNIGHT_ID]
+        while pieces != 0:
+            index = self.return_lsb_position(pieces)
+            if index not in pin_rays:
+                moves += self.serialise_targets(index, self.KNIGHT_TABLE[index] & not_own & check_mask, enemy_bitboard)
+            pieces ^= self.ONE << index
+        
+        # Sliders - a pinned slider can only move along the pin
+        for piece_id in [self.ROOK_ID, self.BISHOP_ID, self.QUEEN_ID]:
+            pieces = own_bitboard & self.piece_bitboards[piece_id]
+            while pieces != 0:
+                index = self.return_lsb_position(pieces)
+                if piece_id == self.ROOK_ID:
+                    targets = self.rook_attacks(index, occupied)
+                elif piece_id == self.BISHOP_ID:
+                    targets = self.bishop_attacks(index, occupied)
                 else:
-                    moves.append(self.encode_move(self.ROOK_PROMOTION, current_position, pushed))
-                    moves.append(self.encode_move(self.BISHOP_PROMOTION, current_position, pushed))
-                    moves.append(self.encode_move(self.KNIGHT_PROMOTION, current_position, pushed))
-                    moves.append(self.encode_move(self.QUEEN_PROMOTION, current_position, pushed))
-                bb |= pushed
-            # Double pushes
-            if current_position & self.SECOND_RANK:
-                pushed = current_position << (self.BOARD_WIDTH * 2)
-                if not (pushed & white_bitboard):
-                    moves.append(self.encode_move(self.DOUBLE_PAWN_PUSH, current_position, pushed))
-                    bb |= pushed
-            
-            # Make a mask for takes
-            mask = ((current_position << self.BOARD_WIDTH) | self.FIRST_RANK) ^ self.FIRST_RANK
-            mask_left = ((mask << np.uint64(1)) | self.RIGHT_BORDER) ^ self.RIGHT_BORDER
-            mask_right = ((mask >> np.uint64(1)) | self.LEFT_BORDER) ^ self.LEFT_BORDER
-            take_mask = mask_left | mask_right
+                    targets = self.rook_attacks(index, occupied) | self.bishop_attacks(index, occupied)
+                targets &= not_own & check_mask
+                if index in pin_rays:
+                    targets &= pin_rays[index]
+                moves += self.serialise_targets(index, targets, enemy_bitboard)
+                pieces ^= self.ONE << index
+        
+        moves += self.generate_legal_pawn_moves(side, king_index, own_bitboard, enemy_bitboard, check_mask, pin_rays, captures_only)
+        return moves
+    
+    def generate_legal_pawn_moves(self, side: int, king_index: int, own_bitboard: np.uint64, enemy_bitboard: np.uint64, check_mask: np.uint64, pin_rays: dict, captures_only: bool = False) -> list:
+        moves = []
+        occupied = own_bitboard | enemy_bitboard
+        if side == self.WHITE_SIDE:
+            forward = self.BOARD_WIDTH
+            double_rank = self.SECOND_RANK
+            promotion_rank = self.EIGTH_RANK
+        else:
+            forward = -self.BOARD_WIDTH
+            double_rank = self.SEVENTH_RANK
+            promotion_rank = self.FIRST_RANK
+        en_passant_square = self.en_passant_square
+        
+        pawns = own_bitboard & self.piece_bitboards[self.PAWN_ID]
+        while pawns != 0:
+            index = self.return_lsb_position(pawns)
+            current_position = self.ONE << index
+            allowed = check_mask & pin_rays[index] if index in pin_rays else check_mask
             
-            takes = take_mask & black_bitboard
+            # Normal pushes & promotions, then double pushes - both squares in front have to be empty
+            pushed_index = index + forward
+            pushed = self.ONE << pushed_index
+            if not (pushed & occupied):
+                if pushed & allowed:
+                    if not (pushed & promotion_rank):
+                        if not captures_only:
+                            moves.append(self.encode_move(self.QUIET_MOVE, index, pushed_index))
+                    else:
+                        moves.append(self.encode_move(self.ROOK_PROMOTION, index, pushed_index))
+                        moves.append(self.encode_move(self.BISHOP_PROMOTION, index, pushed_index))
+                        moves.append(self.encode_move(self.KNIGHT_PROMOTION, index, pushed_index))
+                        moves.append(self.encode_move(self.QUEEN_PROMOTION, index, pushed_index))
+                if current_position & double_rank and not captures_only:
+                    double_index = pushed_index + forward
+                    doubleBB = self.ONE << double_index
+                    if not (doubleBB & occupied) and doubleBB & allowed:
+                        moves.append(self.encode_move(self.DOUBLE_PAWN_PUSH, index, double_index))
             
             # Pawn takes & promotion-takes
-            if not (takes & self.EIGTH_RANK):
-                while takes != 0:
-                    pos = self.return_lsb_position(takes)
-                    moves.append(self.encode_move(self.CAPTURE, current_position, (np.uint64(1) << pos)))
-                    bb |= np.uint64(1) << pos
-                    takes ^= (np.uint64(1) << pos)
-            else:
-                while takes != 0:
-                    pos = self.return_lsb_position(takes)
-                    posBB = (np.uint64(1) << pos)
-                    moves.append(self.encode_move(self.ROOK_PROMOTION, current_position, posBB))
-                    moves.append(self.encode_move(self.BISHOP_PROMOTION, current_position, posBB))
-                    moves.append(self.encode_move(self.KNIGHT_PROMOTION, current_position, posBB))
-                    moves.append(self.encode_move(self.QUEEN_PROMOTION, current_position, posBB))
-                    bb |= posBB
-                    takes ^= (np.uint64(1) << pos)
-            
-            # En passant
-            mask_left = ((current_position << np.uint64(1)) | self.RIGHT_BORDER) ^ self.RIGHT_BORDER
-            mask_right = ((current_position >> np.uint64(1)) | self.LEFT_BORDER) ^ self.LEFT_BORDER
-            ep_mask = mask_left | mask_right
-            
-            en_passantable = ep_mask & black_bitboard
-            
-            if en_passantable and len(move_history) >= 1:
-                # Find last move
-                flag, _, to_pos = self.decode_move(move_history[-1])
-                if flag == self.DOUBLE_PAWN_PUSH and (np.uint64(1) << to_pos) & en_passantable and not (en_passantable & white_bitboard):
-                    moves.append(self.encode_move(self.EP_CAPTURE, current_position, take_mask & (np.uint64(1) << (to_pos + self.BOARD_WIDTH))))
-                    bb |= take_mask & (np.uint64(1) << (to_pos + self.BOARD_WIDTH))
-            
-            
-        elif (current_position & black_bitboard):
-            # Normal pushes and promotions
-            pushed = (current_position >> self.BOARD_WIDTH)
-            if not (pushed & white_bitboard) and not (pushed & black_bitboard) and pushed > 0:
-                if not (pushed & self.FIRST_RANK):
-                    moves.append(self.encode_move(self.QUIET_MOVE, current_position, pushed))
+            take_mask = self.PAWN_ATTACK_TABLE[side][index]
+            takes = take_mask & enemy_bitboard & allowed
+            while takes != 0:
+                pos = self.return_lsb_position(takes)
+                if not (takes & promotion_rank):
+                    moves.append(self.encode_move(self.CAPTURE, index, pos))
                 else:
-                    moves.append(self.encode_move(self.ROOK_PROMOTION, current_position, pushed))
-                    moves.append(self.encode_move(self.BISHOP_PROMOTION, current_position, pushed))
-                    moves.append(self.encode_move(self.KNIGHT_PROMOTION, current_position, pushed))
-                    moves.append(self.encode_move(self.QUEEN_PROMOTION, current_position, pushed))
-                bb |= pushed
-                
-            # Double pushes
-            if current_position & self.SEVENTH_RANK:
-                pushed = current_position >> (self.BOARD_WIDTH * 2)
-                if not (pushed & black_bitboard):
-                    moves.append(self.encode_move(self.DOUBLE_PAWN_PUSH, current_position, pushed))
-                    bb |= pushed
-            
-            # Make a mask for takes
+                    moves.append(self.encode_move(self.ROOK_PROMOTION_CAPTURE, index, pos))
+                    moves.append(self.encode_move(self.BISHOP_PROMOTION_CAPTURE, index, pos))
+                    moves.append(self.encode_move(self.KNIGHT_PROMOTION_CAPTURE, index, pos))
+                    moves.append(self.encode_move(self.QUEEN_PROMOTION_CAPTURE, index, pos))
+                takes ^= self.ONE << pos
             
-            mask = (current_position >> self.BOARD_WIDTH)
-            mask_left = ((mask << np.uint64(1)) | self.RIGHT_BORDER) ^ self.RIGHT_BORDER
-            mask_right = ((mask >> np.uint64(1)) | self.LEFT_BORDER) ^ self.LEFT_BORDER
-            take_mask = mask_left | mask_right
-            
-            takes = take_mask & white_bitboard
-            
-            # Pawn takes and promotion-takes
-            if not (takes & self.FIRST_RANK):
-                while takes != 0:
-                    pos = self.return_lsb_position(takes)
-                    moves.append(self.encode_move(self.CAPTURE, current_position, (np.uint64(1) << pos)))
-                    bb |= np.uint64(1) << pos
-                    takes ^= (np.uint64(1) << pos)
-            else:
-                while takes != 0:
-                    pos = self.return_lsb_position(takes)
-                    posBB = (np.uint64(1) << pos)
-                    moves.append(self.encode_move(self.ROOK_PROMOTION, current_position, posBB))
-                    moves.append(self.encode_move(self.BISHOP_PROMOTION, current_position, posBB))
-                    moves.append(self.encode_move(self.KNIGHT_PROMOTION, current_position, posBB))
-                    moves.append(self.encode_move(self.QUEEN_PROMOTION, current_position, posBB))
-                    bb |= posBB
-                    takes ^= (np.uint64(1) << pos)
+            # En passant - two pawns leave the same rank at once, so pins and checks are tested on the resulting board instead
+            if en_passant_square != self.NULL_POSITION and take_mask & (self.ONE << en_passant_square):
+                if self.is_legal_en_passant(index, en_passant_square, en_passant_square - forward, king_index, occupied, enemy_bitboard):
+                    moves.append(self.encode_move(self.EP_CAPTURE, index, en_passant_square))
             
-            # En passant
-            mask_left = ((current_position << np.uint64(1)) | self.RIGHT_BORDER) ^ self.RIGHT_BORDER
-            mask_right = ((current_position >> np.uint64(1)) | self.LEFT_BORDER) ^ self.LEFT_BORDER
-            ep_mask = mask_left | mask_right
-            
-            en_passantable = ep_mask & white_bitboard
-            
-            if en_passantable and len(move_history) >= 1:
-                # Find last move
-                flag, _, to_pos = self.decode_move(move_history[-1])
-                if flag == self.DOUBLE_PAWN_PUSH and (np.uint64(1) << to_pos) & en_passantable and not en_passantable & white_bitboard:
-                    moves.append(self.encode_move(self.EP_CAPTURE, current_position, take_mask & (np.uint64(1) << (to_pos + self.BOARD_WIDTH))))
-                    bb |= take_mask & (np.uint64(1) << (to_pos + self.BOARD_WIDTH))
-                
-        return moves if not return_bb else bb
+            pawns ^= current_position
+        return moves
     
-    def generate_knight_moves(self, current_position: np.uint64, white_bitboard: np.uint64, black_bitboard: np.uint64, return_bb = False):
+    def generate_castling_moves(self, side: int, king_index: int, occupied: np.uint64, enemy_bitboard: np.uint64) -> list:
+        """Castling moves for side, assuming side is not in check."""
         moves = []
-        bb = np.uint64(0)
-        index = self.return_lsb_position(current_position)
+        if side == self.WHITE_SIDE:
+            castles = [(self.castling_rights & self.CASTLE_WHITE_SHORT, self.KING_CASTLE, 0), (self.castling_rights & self.CASTLE_WHITE_LONG, self.QUEEN_CASTLE, 7)]
+        else:
+            castles = [(self.castling_rights & self.CASTLE_BLACK_SHORT, self.KING_CASTLE, 56), (self.castling_rights & self.CASTLE_BLACK_LONG, self.QUEEN_CASTLE, 63)]
+        
+        own_rooks = self.side_bitboards[side] & self.piece_bitboards[self.ROOK_ID]
+        enemy_attacks = self.attacked_squares(1 - side)
+        for allowed, flag, rook_square in castles:
+            if not allowed or not (own_rooks & (self.ONE << rook_square)):
+                continue
+            # Everything between king and rook has to be empty
+            if self.BETWEEN_TABLE[king_index][rook_square] & occupied:
+                continue
+            # And the king can't pass through or land on an attacked square
+            king_to = self.CASTLING_SQUARES[rook_square][0]
+            path = self.BETWEEN_TABLE[king_index][king_to] | (self.ONE << king_to)
+            if not (path & enemy_attacks):
+                moves.append(self.encode_move(flag, king_index, rook_square))
+        return moves
+    
+    def find_pins(self, king_index: int, own_bitboard: np.uint64, enemy_bitboard: np.uint64, occupied: np.uint64) -> dict:
+        """Return {pinned square: squares that piece may still move to} for side's pinned pieces."""
+        pin_rays = {}
+        straight = enemy_bitboard & (self.piece_bitboards[self.ROOK_ID] | self.piece_bitboards[self.QUEEN_ID])
+        diagonal = enemy_bitboard & (self.piece_bitboards[self.BISHOP_ID] | self.piece_bitboards[self.QUEEN_ID])
+        snipers = (self.ROOK_RAYS[king_index] & straight) | (self.BISHOP_RAYS[king_index] & diagonal)
+        
+        while snipers != 0:
+            sniper = self.return_lsb_position(snipers)
+            ray = self.BETWEEN_TABLE[king_index][sniper]
+            blockers = ray & occupied
+            # Exactly one piece in the way, and it's ours
+            if blockers and not (blockers & (blockers - self.ONE)) and blockers & own_bitboard:
+                pin_rays[self.return_lsb_position(blockers)] = ray | (self.ONE << sniper)
+            snipers ^= self.ONE << sniper
+        return pin_rays
+    
+    def is_legal_en_passant(self, from_pos: int, to_pos: int, captured_pos: int, king_index: int, occupied: np.uint64, enemy_bitboard: np.uint64) -> bool:
+        capturedBB = self.ONE << captured_pos
+        if not (capturedBB & enemy_bitboard & self.piece_bitboards[self.PAWN_ID]):
+            return False
         
-        possible_moves = np.uint64(lookuptables.KNIGHT_TABLE[index])
+        occupied_after = occupied ^ (self.ONE << from_pos) ^ (self.ONE << to_pos) ^ capturedBB
+        return not (self.attackers_to(king_index, occupied_after) & (enemy_bitboard ^ capturedBB))
+    
+    def attackers_to(self, index: int, occupancy: np.uint64) -> np.uint64:
+        """Return every piece, of either side, that attacks the square index when the board holds occupancy."""
+        white_bitboard = self.side_bitboards[self.WHITE_SIDE]
+        pawns = self.piece_bitboards[self.PAWN_ID]
+        queens = self.piece_bitboards[self.QUEEN_ID]
+        # A white pawn attacks index if a black pawn on index would attack it, and the other way around
+        return ((self.PAWN_ATTACK_TABLE[self.BLACK_SIDE][index] & pawns & white_bitboard)
+                | (self.PAWN_ATTACK_TABLE[self.WHITE_SIDE][index] & pawns & self.side_bitboards[self.BLACK_SIDE])
+                | (self.KNIGHT_TABLE[index] & self.piece_bitboards[self.KNIGHT_ID])
+                | (self.KING_TABLE[index] & self.piece_bitboards[self.KING_ID])
+                | (self.rook_attacks(index, occupancy) & (self.piece_bitboards[self.ROOK_ID] | queens))
+                | (self.bishop_attacks(index, occupancy) & (self.piece_bitboards[self.BISHOP_ID] | queens)))
+    
+    def attacked_squares(self, side: int) -> np.uint64:
+        """Return every square side attacks, computed once per position and reused until the position changes.
+        
+        The other side's king is left out of the occupancy, so a square behind it on a slider's ray counts
+        as attacked - which is what king moves need, and changes nothing for checks or castling."""
+        attacks = self.attack_maps[side]
+        if attacks is None:
+            attacks = self.compute_attacked_squares(side)
+            self.attack_maps[side] = attacks
+        return attacks
+    
+    def compute_attacked_squares(self, side: int) -> np.uint64:
+        own_bitboard = self.side_bitboards[side]
+        enemy_king = self.piece_bitboards[self.KING_ID] & self.side_bitboards[1 - side]
+        occupancy = (own_bitboard | self.side_bitboards[1 - side]) ^ enemy_king
+        
+        # Pawns set-wise - bit 0 is h1, so a shift of 9 (white) or 7 (black) goes towards the a file,
+        # and anything that wrapped round onto the far file is masked off
+        pawns = own_bitboard & self.piece_bitboards[self.PAWN_ID]
+        if side == self.WHITE_SIDE:
+            attacks = ((pawns << 9) & self.NOT_RIGHT_BORDER) | ((pawns << 7) & self.NOT_LEFT_BORDER)
+        else:
+            attacks = ((pawns >> 7) & self.NOT_RIGHT_BORDER) | ((pawns >> 9) & self.NOT_LEFT_BORDER)
+        
+        king = own_bitboard & self.piece_bitboards[self.KING_ID]
+        if king:
+            attacks |= self.KING_TABLE[self.return_lsb_position(king)]
+        # Knights set-wise too, masking off jumps that wrapped round by one or two files
+        knights = own_bitboard & self.piece_bitboards[self.KNIGHT_ID]
+        if knights:
+            attacks |= ((((knights << 17) | (knights >> 15)) & self.NOT_RIGHT_BORDER)
+                        | (((knights << 15) | (knights >> 17)) & self.NOT_LEFT_BORDER)
+                        | (((knights << 10) | (knights >> 6)) & self.NOT_RIGHT_TWO_FILES)
+                        | (((knights << 6) | (knights >> 10)) & self.NOT_LEFT_TWO_FILES))
+        
+        queens = self.piece_bitboards[self.QUEEN_ID]
+        pieces = own_bitboard & (self.piece_bitboards[self.ROOK_ID] | queens)
+        while pieces != 0:
+            index = self.return_lsb_position(pieces)
+            attacks |= self.rook_attacks(index, occupancy)
+            pieces ^= self.ONE << index
+        pieces = own_bitboard & (self.piece_bitboards[self.BISHOP_ID] | queens)
+        while pieces != 0:
+            index = self.return_lsb_position(pieces)
+            attacks |= self.bishop_attacks(index, occupancy)
+            pieces ^= self.ONE << index
+        return attacks
+    
+    def static_exchange(self, move: np.uint16) -> int:
+        """Return the material the side to move gains (or loses, if negative) from a capture once both
+        sides have finished recapturing on its square, each always using their least valuable piece."""
+        flag, from_pos, to_pos = self.decode_move(move)
+        occupancy = self.side_bitboards[self.WHITE_SIDE] | self.side_bitboards[self.BLACK_SIDE]
+        
+        # Nothing recaptures on a square the other side doesn't attack - as long as no slider of theirs
+        # is aimed at the square the piece leaves, which could see through it once it has gone
+        if (flag != self.EP_CAPTURE and flag in self.CAPTURE_FLAGS
+                and not (self.attacked_squares(1 - self.side_to_move) & ((self.ONE << from_pos) | (self.ONE << to_pos)))):
+            gain = self.SEE_VALUES[self.mailbox[to_pos] & self.MAILBOX_PIECE_MASK]
+            if flag in self.PROMOTION_FLAGS:
+                gain += self.SEE_VALUES[self.PROMOTION_FLAGS[flag]] - self.SEE_VALUES[self.PAWN_ID]
+            return gain
+        
+        if flag == self.EP_CAPTURE:
+            gain = self.SEE_VALUES[self.PAWN_ID]
+            occupancy ^= self.ONE << (to_pos - self.BOARD_WIDTH if self.side_to_move == self.WHITE_SIDE else to_pos + self.BOARD_WIDTH)
+        elif flag in self.CAPTURE_FLAGS:
+            gain = self.SEE_VALUES[self.mailbox[to_pos] & self.MAILBOX_PIECE_MASK]
+        else:
+            gain = 0
+        
+        # Value of the piece now standing on the square, which the other side can win back next
+        on_square = self.SEE_VALUES[self.mailbox[from_pos] & self.MAILBOX_PIECE_MASK]
+        if flag in self.PROMOTION_FLAGS:
+            on_square = self.SEE_VALUES[self.PROMOTION_FLAGS[flag]]
+            gain += on_square - self.SEE_VALUES[self.PAWN_ID]
+        occupancy ^= self.ONE << from_pos
+        
+        # gains[i] is what the side making the i-th capture has won so far, if the exchange stops there
+        gains = [gain]
+        side = 1 - self.side_to_move
+        while True:
+            # attackers_to goes by piece bitboards, so pieces already traded off are masked out with occupancy.
+            # Recomputing it with the new occupancy lets sliders behind them join in.
+            attackers = self.attackers_to(to_pos, occupancy) & occupancy
+            own_attackers = attackers & self.side_bitboards[side]
+            if not own_attackers:
+                break
+            for piece_id in self.SEE_ORDER:
+                candidates = own_attackers & self.piece_bitboards[piece_id]
+                if candidates:
+                    break
+            # The king can only take last
+            if piece_id == self.KING_ID and attackers & self.side_bitboards[1 - side]:
+                break
+            gains.append(on_square - gains[-1])
+            on_square = self.SEE_VALUES[piece_id]
+            occupancy ^= self.ONE << self.return_lsb_position(candidates)
+            side = 1 - side
+        
+        # Either side can stop recapturing whenever carrying on would lose material
+        for index in range(len(gains) - 1, 0, -1):
+            gains[index - 1] = -max(-gains[index - 1], gains[index])
+        return gains[0]
+    
+    def generate_pawn_moves(self, current_position: np.uint64, white_bitboard: np.uint64, black_bitboard: np.uint64, return_bb = False):
+        """Generate pawn moves. With return_bb, return only the squares the pawn attacks."""
+        moves = []
+        index = self.return_lsb_position(current_position)
         
         if current_position & white_bitboard:
-            possible_moves = (possible_moves & white_bitboard) ^ white_bitboard
-            while possible_moves != 0:
-                current = self.return_lsb_position(possible_moves)
-                move_flag = self.CAPTURE if (np.uint64(1) << current) & black_bitboard else self.QUIET_MOVE
-                moves.append(self.encode_move(move_flag, index, current))
-                bb |= np.uint64(1) << current
-                possible_moves ^= (np.uint64(1) << current)
+            side = self.WHITE_SIDE
+            enemy_bitboard = black_bitboard
+            pushed_index = index + self.BOARD_WIDTH
+            double_rank = self.SECOND_RANK
+            promotion_rank = self.EIGTH_RANK
         elif current_position & black_bitboard:
-            possible_moves = (possible_moves & black_bitboard) ^ black_bitboard
-            while possible_moves != 0:
-                current = self.return_lsb_position(possible_moves)
-                move_flag = self.CAPTURE if (np.uint64(1) << current) & white_bitboard else self.QUIET_MOVE
-                moves.append(self.encode_move(move_flag, index, current))
-                bb |= np.uint64(1) << current
-                possible_moves ^= (np.uint64(1) << current)
+            side = self.BLACK_SIDE
+            enemy_bitboard = white_bitboard
+            pushed_index = index - self.BOARD_WIDTH
+            double_rank = self.SEVENTH_RANK
+            promotion_rank = self.FIRST_RANK
+        else:
+            return moves if not return_bb else self.ZERO
+        
+        take_mask = self.PAWN_ATTACK_TABLE[side][index]
+        if return_bb:
+            return take_mask
+        
+        occupied = white_bitboard | black_bitboard
+        
+        # Normal pushes & promotions
+        pushed = self.ONE << pushed_index
+        if not (pushed & occupied):
+            if not (pushed & promotion_rank):
+                moves.append(self.encode_move(self.QUIET_MOVE, index, pushed_index))
+            else:
+                moves.append(self.encode_move(self.ROOK_PROMOTION, index, pushed_index))
+                moves.append(self.encode_move(self.BISHOP_PROMOTION, index, pushed_index))
+                moves.append(self.encode_move(self.KNIGHT_PROMOTION, index, pushed_index))
+                moves.append(self.encode_move(self.QUEEN_PROMOTION, index, pushed_index))
+            
+            # Double pushes - both squares in front have to be empty
+            if current_position & double_rank:
+                double_index = 2 * pushed_index - index
+                if not ((self.ONE << double_index) & occupied):
+                    moves.append(self.encode_move(self.DOUBLE_PAWN_PUSH, index, double_index))
         
-        return moves if not return_bb else bb
+        # Pawn takes & promotion-takes
+        takes = take_mask & enemy_bitboard
+        while takes != 0:
+            pos = self.return_lsb_position(takes)
+            if not (takes & promotion_rank):
+                moves.append(self.encode_move(self.CAPTURE, index, pos))
+            else:
+                moves.append(self.encode_move(self.ROOK_PROMOTION_CAPTURE, index, pos))
+                moves.append(self.encode_move(self.BISHOP_PROMOTION_CAPTURE, index, pos))
+                moves.append(self.encode_move(self.KNIGHT_PROMOTION_CAPTURE, index, pos))
+                moves.append(self.encode_move(self.QUEEN_PROMOTION_CAPTURE, index, pos))
+            takes ^= (self.ONE << pos)
+        
+        # En passant - the square has to be behind an enemy pawn
+        if self.en_passant_square != self.NULL_POSITION and take_mask & (self.ONE << self.en_passant_square):
+            if (self.ONE << (self.en_passant_square + index - pushed_index)) & enemy_bitboard:
+                moves.append(self.encode_move(self.EP_CAPTURE, index, self.en_passant_square))
+                
+        return moves
+    
+    def generate_knight_moves(self, current_position: np.uint64, white_bitboard: np.uint64, black_bitboard: np.uint64, return_bb = False):
+        index = self.return_lsb_position(current_position)
+        possible_moves = self.KNIGHT_TABLE[index]
+        
+        if return_bb:
+            return possible_moves
+        return self.serialise_moves(index, possible_moves, current_position, white_bitboard, black_bitboard)
     
     def generate_king_moves(self, current_position: np.uint64, white_bitboard: np.uint64, black_bitboard: np.uint64, return_bb = False):
         
         # Standard moves & castling
-        moves = []
-        bb = np.uint64(0)
         index = self.return_lsb_position(current_position)
+        possible_moves = self.KING_TABLE[index]
         
-        possible_moves = np.uint64(lookuptables.KING_TABLE[index])
-        castle_bools = self.castle_bools_queue.get()
-        self.castle_bools_queue.put(castle_bools)
+        if return_bb:
+            return possible_moves
         
+        # Standard moves
+        moves = self.serialise_moves(index, possible_moves, current_position, white_bitboard, black_bitboard)
+        
+        # Castling
         if current_position & white_bitboard:
-            # Standard moves
-            possible_moves = (possible_moves & white_bitboard) ^ white_bitboard
-            while possible_moves != 0:
-                current = self.return_lsb_position(possible_moves)
-                move_flag = self.CAPTURE if (np.uint64(1) << current) & black_bitboard else self.QUIET_MOVE
-                moves.append(self.encode_move(move_flag, index, current))
-                bb |= np.uint64(1) << current
-                possible_moves ^= (np.uint64(1) << current)
-            
-            # Castling
-            
-            if castle_bools[self.CASTLE_WHITE_KING]:
-                # Rays of sight
-                sight = self.generate_sliding_moves(current_position, white_bitboard, black_bitboard, self.ROOK_ID)
+            if self.castling_rights & (self.CASTLE_WHITE_SHORT | self.CASTLE_WHITE_LONG):
+                # Rays of sight - if the king can see the rook, there is nothing between them
+                sight = self.generate_sliding_moves(current_position, white_bitboard, black_bitboard, self.ROOK_ID, True)
                 
                 # Short castle
-                if castle_bools[self.CASTLE_WHITE_SHORT_ROOK] and np.uint16(0b0000000011000001) in sight:
-                    moves.append(self.encode_move(self.KING_CASTLE, current_position, 0))
-                    bb |= 0b0000000011000001
+                if self.castling_rights & self.CASTLE_WHITE_SHORT and sight & (self.ONE << 0):
+                    moves.append(self.encode_move(self.KING_CASTLE, index, 0))
                 
                 # Long castle
-                if castle_bools[self.CASTLE_WHITE_LONG_ROOK] and np.uint16(0b0000000011000111) in sight:
-                    moves.append(self.encode_move(self.KING_CASTLE, current_position, 7))
-                    bb |= 0b0000000011000111
-                    
+                if self.castling_rights & self.CASTLE_WHITE_LONG and sight & (self.ONE << 7):
+                    moves.append(self.encode_move(self.QUEEN_CASTLE, index, 7))
 
         elif current_position & black_bitboard:
-            possible_moves = (possible_moves & black_bitboard) ^ black_bitboard
-            while possible_moves != 0:
-                current = self.return_lsb_position(possible_moves)
-                move_flag = self.CAPTURE if (np.uint64(1) << current) & white_bitboard else self.QUIET_MOVE
-                moves.append(self.encode_move(move_flag, index, current))
-                bb |= np.uint64(1) << current
-                possible_moves ^= (np.uint64(1) << current)
-                
-            if castle_bools[self.CASTLE_BLACK_KING]:
+            if self.castling_rights & (self.CASTLE_BLACK_SHORT | self.CASTLE_BLACK_LONG):
                 # Rays of sight
-                sight = self.generate_sliding_moves(current_position, white_bitboard, black_bitboard, self.ROOK_ID)
+                sight = self.generate_sliding_moves(current_position, white_bitboard, black_bitboard, self.ROOK_ID, True)
                 
                 # Short castle
-                if castle_bools[self.CASTLE_BLACK_SHORT_ROOK] and np.uint16(0b0000111011111000) in sight:
-                    moves.append(self.encode_move(self.KING_CASTLE, current_position, 56))
-                    bb |= 0b0000111011111000
+                if self.castling_rights & self.CASTLE_BLACK_SHORT and sight & (self.ONE << 56):
+                    moves.append(self.encode_move(self.KING_CASTLE, index, 56))
                 
                 # Long castle
-                if castle_bools[self.CASTLE_BLACK_LONG_ROOK] and np.uint16(0b0000111011111111) in sight:
-                    moves.append(self.encode_move(self.KING_CASTLE, current_position, 63))
-                    bb |= 0b0000111011111111
+                if self.castling_rights & self.CASTLE_BLACK_LONG and sight & (self.ONE << 63):
+                    moves.append(self.encode_move(self.QUEEN_CASTLE, index, 63))
 
-        return moves if not return_bb else bb
+        return moves
         
     def generate_sliding_moves(self, current_position: np.uint64, white_bitboard: np.uint64, black_bitboard: np.uint64, piece_id, return_bb = False):
-        moves = []
-        bb = np.uint64(0)
         index = self.return_lsb_position(current_position)
+        occupied = white_bitboard | black_bitboard
         
         if piece_id == self.ROOK_ID:
-            index_number = magicnums.ROOK_MOVES[index].index_number
-            magic_number = magicnums.ROOK_MOVES[index].magic
-            offset = magicnums.ROOK_MOVES[index].offset
-            mask = magicnums.ROOK_MOVES[index].mask
-            
-            blockers = (white_bitboard | black_bitboard) & mask
-            possible_moves = np.uint64(self.ROOK_TABLE[self.generate_magic_index(blockers, magic_number, index_number, offset)])
+            possible_moves = self.rook_attacks(index, occupied)
         elif piece_id == self.BISHOP_ID:
-            index_number = magicnums.BISHOP_MOVES[index].index_number
-            magic_number = magicnums.BISHOP_MOVES[index].magic
-            offset = magicnums.BISHOP_MOVES[index].offset
-            mask = magicnums.BISHOP_MOVES[index].mask
-            
-            blockers = (white_bitboard | black_bitboard) & mask
-            possible_moves = np.uint64(self.BISHOP_TABLE[self.generate_magic_index(blockers, magic_number, index_number, offset)])
+            possible_moves = self.bishop_attacks(index, occupied)
         elif piece_id == self.QUEEN_ID:
-            if not return_bb:
-                return self.generate_sliding_moves(current_position, white_bitboard, black_bitboard, self.ROOK_ID) + self.generate_sliding_moves(current_position, white_bitboard, black_bitboard, self.BISHOP_ID)
-            else:
-                return self.generate_sliding_moves(current_position, white_bitboard, black_bitboard, self.ROOK_ID, True) | self.generate_sliding_moves(current_position, white_bitboard, black_bitboard, self.BISHOP_ID, True)
+            possible_moves = self.rook_attacks(index, occupied) | self.bishop_attacks(index, occupied)
+        
+        if return_bb:
+            return possible_moves
+        return self.serialise_moves(index, possible_moves, current_position, white_bitboard, black_bitboard)
+    
+    def serialise_moves(self, index: int, possible_moves: np.uint64, current_position: np.uint64, white_bitboard: np.uint64, black_bitboard: np.uint64) -> list:
+        """Turn a bitboard of target squares into a list of quiet moves and captures."""
         if current_position & white_bitboard:
-            possible_moves = (possible_moves & white_bitboard) ^ white_bitboard
-            while possible_moves != 0:
-                current = self.return_lsb_position(possible_moves)
-                move_flag = self.CAPTURE if (np.uint64(1) << current) & black_bitboard else self.QUIET_MOVE
-                moves.append(self.encode_move(move_flag, index, current))
-                bb |= np.uint64(1) << current
-                possible_moves ^= (np.uint64(1) << current)
-        elif current_position & black_bitboard:
-            possible_moves = (possible_moves & black_bitboard) ^ black_bitboard
-            while possible_moves != 0:
-                current = self.return_lsb_position(possible_moves)
-                move_flag = self.CAPTURE if (np.uint64(1) << current) & white_bitboard else self.QUIET_MOVE
-                moves.append(self.encode_move(move_flag, index, current))
-                bb |= np.uint64(1) << current
-                possible_moves ^= (np.uint64(1) << current)
-            
-        return moves if not return_bb else bb
+            own_bitboard, enemy_bitboard = white_bitboard, black_bitboard
+        else:
+            own_bitboard, enemy_bitboard = black_bitboard, white_bitboard
+        
+        return self.serialise_targets(index, (possible_moves & own_bitboard) ^ possible_moves, enemy_bitboard)
+    
+    def serialise_targets(self, index: int, possible_moves: np.uint64, enemy_bitboard: np.uint64) -> list:
+        """Turn a bitboard of target squares, none of them our own pieces, into a list of quiet moves and captures."""
+        moves = []
+        while possible_moves != 0:
+            current = self.return_lsb_position(possible_moves)
+            currentBB = self.ONE << current
+            move_flag = self.CAPTURE if currentBB & enemy_bitboard else self.QUIET_MOVE
+            moves.append(self.encode_move(move_flag, index, current))
+            possible_moves ^= currentBB
+        return moves
+    
+    def rook_attacks(self, index: int, occupancy: np.uint64) -> np.uint64:
+        mask, magic_number, index_number, offset = magictables.ROOK_MAGICS[index]
+        return self.ROOK_TABLE[self.generate_magic_index(occupancy & mask, magic_number, index_number, offset)]
+    
+    def bishop_attacks(self, index: int, occupancy: np.uint64) -> np.uint64:
+        mask, magic_number, index_number, offset = magictables.BISHOP_MAGICS[index]
+        return self.BISHOP_TABLE[self.generate_magic_index(occupancy & mask, magic_number, index_number, offset)]
     
     # MOVE EXECUTION
     def make_move(self, move: np.uint16):
 
         flag, from_pos, to_pos = self.decode_move(move)
         
-        fromBB = np.uint64(1) << from_pos
-        toBB = np.uint64(1) << to_pos
+        fromBB = self.ONE << from_pos
+        toBB = self.ONE << to_pos
         fromToBB = fromBB ^ toBB
         
         # First, find the piece_id and color
-        piece_id = -1
-        for id, bb in enumerate(self.piece_bitboards):
-            if fromBB & bb:
-                piece_id = id
-                break
+        square = self.mailbox[from_pos]
+        piece_id = square & self.MAILBOX_PIECE_MASK
+        side = square >> self.MAILBOX_SIDE_SHIFT
         
-        side = -1
-        for id, color in enumerate(self.side_bitboards):
-            if fromBB & color:
-                side = id
-        
-        castle_bools = self.castle_bools_queue.get()
-        self.castle_bools_queue.put(castle_bools)
-        
-        # Update castling parameters depending on position of original position
-        if piece_id in [self.ROOK_ID, self.KING_ID]:
-            if from_pos == 0:
-                castle_bools[self.CASTLE_WHITE_SHORT_ROOK] = False
-            elif from_pos == 3:
-                castle_bools[self.CASTLE_WHITE_KING] = False
-            elif from_pos == 3:
-                castle_bools[self.CASTLE_WHITE_LONG_ROOK] = False
-            elif from_pos == 56:
-                castle_bools[self.CASTLE_BLACK_SHORT_ROOK] = False
-            elif from_pos == 59:
-                castle_bools[self.CASTLE_BLACK_KING] = False
-            elif from_pos == 63:
-                castle_bools[self.CASTLE_BLACK_LONG_ROOK] = False
-            
-        # Update quiet moves first
-        self.piece_bitboards[piece_id] ^= fromToBB
-        self.side_bitboards[side] ^= fromToBB
+        captured_piece_id = self.mailbox[to_pos] & self.MAILBOX_PIECE_MASK if flag in self.CAPTURE_FLAGS else self.EMPTY_ID
+        self.push_undo_record(captured_piece_id)
         
-        # Then update captures
-        if flag in [self.CAPTURE, self.BISHOP_PROMOTION_CAPTURE, self.KNIGHT_PROMOTION_CAPTURE, self.QUEEN_PROMOTION_CAPTURE, self.ROOK_PROMOTION_CAPTURE]:
-            # Find id and color of captured piece
-            captured_piece_id = -1
-            for id, bb in enumerate(self.piece_bitboards):
-                if toBB & bb:
-                    captured_piece_id = id
-                    break
-            
+        # Update irreversible state
+        piece_keys = zobrist.PIECE_KEYS
+        self.hash ^= zobrist.SIDE_KEY ^ zobrist.CASTLING_KEYS[self.castling_rights] ^ zobrist.EN_PASSANT_KEYS[self.en_passant_square]
+        self.castling_rights &= self.CASTLING_RIGHTS_KEPT[from_pos] & self.CASTLING_RIGHTS_KEPT[to_pos]
+        self.en_passant_square = (from_pos + to_pos) // 2 if flag == self.DOUBLE_PAWN_PUSH else self.NULL_POSITION
+        self.hash ^= zobrist.CASTLING_KEYS[self.castling_rights] ^ zobrist.EN_PASSANT_KEYS[self.en_passant_square]
+        if piece_id == self.PAWN_ID or captured_piece_id != self.EMPTY_ID or flag == self.EP_CAPTURE:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        
+        # Then update captures, before the moving piece lands on the square
+        mg_scores = self.MG_SQUARE_SCORES
+        eg_scores = self.EG_SQUARE_SCORES
+        if flag in self.CAPTURE_FLAGS:
             # Captured side is opposite of taking side
             captured_side = 1 - side
             
             self.piece_bitboards[captured_piece_id] ^= toBB
             self.side_bitboards[captured_side] ^= toBB
+            self.hash ^= piece_keys[captured_side][captured_piece_id][to_pos]
+            if captured_piece_id == self.PAWN_ID:
+                self.pawn_hash ^= piece_keys[captured_side][self.PAWN_ID][to_pos]
+            self.mg_score -= mg_scores[captured_side][captured_piece_id][to_pos]
+            self.eg_score -= eg_scores[captured_side][captured_piece_id][to_pos]
+            self.game_phase -= self.GAMEPHASE_INC[captured_piece_id]
         
-        elif flag in [self.EP_CAPTURE]:
+        elif flag == self.EP_CAPTURE:
             if side == self.WHITE_SIDE:
-                capturedBB = np.uint64(1) << (to_pos - self.BOARD_WIDTH)
+                captured_pos = to_pos - self.BOARD_WIDTH
             elif side == self.BLACK_SIDE:
-                capturedBB = np.uint64(1) << (to_pos + self.BOARD_WIDTH)
+                captured_pos = to_pos + self.BOARD_WIDTH
+            capturedBB = self.ONE << captured_pos
                 
             captured_side = 1 - side
             # We know that the captured piece must be a pawn
             self.piece_bitboards[self.PAWN_ID] ^= capturedBB
             self.side_bitboards[captured_side] ^= capturedBB
+            self.mailbox[captured_pos] = self.EMPTY_ID
+            self.hash ^= piece_keys[captured_side][self.PAWN_ID][captured_pos]
+            self.pawn_hash ^= piece_keys[captured_side][self.PAWN_ID][captured_pos]
+            self.mg_score -= mg_scores[captured_side][self.PAWN_ID][captured_pos]
+            self.eg_score -= eg_scores[captured_side][self.PAWN_ID][captured_pos]
+            
+        # Update quiet moves
+        if flag == self.KING_CASTLE or flag == self.QUEEN_CASTLE:
+            self.castle_pieces(side, from_pos, to_pos)
+            king_to, rook_to = self.CASTLING_SQUARES[to_pos]
+            self.hash ^= (piece_keys[side][self.KING_ID][from_pos] ^ piece_keys[side][self.KING_ID][king_to]
+                          ^ piece_keys[side][self.ROOK_ID][to_pos] ^ piece_keys[side][self.ROOK_ID][rook_to])
+            self.update_castling_scores(side, from_pos, to_pos, 1)
+        else:
+            self.piece_bitboards[piece_id] ^= fromToBB
+            self.side_bitboards[side] ^= fromToBB
+            self.mailbox[to_pos] = square
+            self.mailbox[from_pos] = self.EMPTY_ID
+            self.hash ^= piece_keys[side][piece_id][from_pos] ^ piece_keys[side][piece_id][to_pos]
+            if piece_id == self.PAWN_ID:
+                self.pawn_hash ^= piece_keys[side][piece_id][from_pos] ^ piece_keys[side][piece_id][to_pos]
+            self.mg_score += mg_scores[side][piece_id][to_pos] - mg_scores[side][piece_id][from_pos]
+            self.eg_score += eg_scores[side][piece_id][to_pos] - eg_scores[side][piece_id][from_pos]
         
         # Promotions
-        if flag in [self.BISHOP_PROMOTION, self.BISHOP_PROMOTION_CAPTURE, self.KNIGHT_PROMOTION, self.KNIGHT_PROMOTION_CAPTURE, self.QUEEN_PROMOTION, self.QUEEN_PROMOTION_CAPTURE, self.ROOK_PROMOTION, self.BISHOP_PROMOTION_CAPTURE]:
+        if flag in self.PROMOTION_FLAGS:
+            promoted_piece_id = self.PROMOTION_FLAGS[flag]
             self.piece_bitboards[piece_id] ^= toBB
-            if flag in [self.BISHOP_PROMOTION, self.BISHOP_PROMOTION_CAPTURE]:
-                self.piece_bitboards[self.BISHOP_ID] ^= toBB
-            elif flag in [self.KNIGHT_PROMOTION, self.KNIGHT_PROMOTION_CAPTURE]:
-                self.piece_bitboards[self.KNIGHT_ID] ^= toBB
-            elif flag in [self.QUEEN_PROMOTION, self.QUEEN_PROMOTION_CAPTURE]:
-                self.piece_bitboards[self.QUEEN_ID] ^= toBB
-            elif flag in [self.ROOK_PROMOTION, self.ROOK_PROMOTION_CAPTURE]:
-                self.piece_bitboards[self.ROOK_ID] ^= toBB
+            self.piece_bitboards[promoted_piece_id] ^= toBB
+            self.mailbox[to_pos] = (side << self.MAILBOX_SIDE_SHIFT) | promoted_piece_id
+            self.hash ^= piece_keys[side][piece_id][to_pos] ^ piece_keys[side][promoted_piece_id][to_pos]
+            self.pawn_hash ^= piece_keys[side][piece_id][to_pos]
+            self.mg_score += mg_scores[side][promoted_piece_id][to_pos] - mg_scores[side][piece_id][to_pos]
+            self.eg_score += eg_scores[side][promoted_piece_id][to_pos] - eg_scores[side][piece_id][to_pos]
+            self.game_phase += self.GAMEPHASE_INC[promoted_piece_id]
         
         self.move_history.append(move)
-        self.castle_bools_queue.put(castle_bools)
+        self.side_to_move = 1 - self.side_to_move
+        
+        if self.debug_hash:
+            self.verify_hash()
+        if self.debug_eval:
+            self.verify_evaluation()
         
         
-    def unmake_move(self, history: list):
-        last_move = history[-1]
+    def unmake_move(self, history: list = None):
+        if history is None:
+            history = self.move_history
+        last_move = history.pop()
         flag, from_pos, to_pos = self.decode_move(last_move)
         
-        fromBB = np.uint64(1) << from_pos
-        toBB = np.uint64(1) << to_pos
+        fromBB = self.ONE << from_pos
+        toBB = self.ONE << to_pos
         fromToBB = fromBB ^ toBB
         
-        # First, find the piece_id and color
-        piece_id = -1
-        for id, bb in enumerate(self.piece_bitboards):
-            if fromBB & bb:
-                piece_id = id
-                break
+        # Reset irreversible state to what it was before the move
+        captured_piece_id = self.pop_undo_record()
+        self.side_to_move = 1 - self.side_to_move
         
-        side = -1
-        for id, color in enumerate(self.side_bitboards):
-            if fromBB & color:
-                side = id
+        # Castling - moving the same pieces again puts them back
+        if flag == self.KING_CASTLE or flag == self.QUEEN_CASTLE:
+            self.castle_pieces(self.side_to_move, from_pos, to_pos)
+            self.update_castling_scores(self.side_to_move, from_pos, to_pos, -1)
+            if self.debug_hash:
+                self.verify_hash()
+            if self.debug_eval:
+                self.verify_evaluation()
+            return
         
-        # Reset castle bools queue to previous state
-        self.castle_bools_queue.get()
-        self.move_history = self.move_history[:-1]
+        # First, find the piece_id and color - the piece now sits on the square it moved to
+        square = self.mailbox[to_pos]
+        piece_id = square & self.MAILBOX_PIECE_MASK
+        side = square >> self.MAILBOX_SIDE_SHIFT
         
         # Undo promotions
-        if flag in [self.BISHOP_PROMOTION, self.BISHOP_PROMOTION_CAPTURE, self.KNIGHT_PROMOTION, self.KNIGHT_PROMOTION_CAPTURE, self.QUEEN_PROMOTION, self.QUEEN_PROMOTION_CAPTURE, self.ROOK_PROMOTION, self.BISHOP_PROMOTION_CAPTURE]:
+        mg_scores = self.MG_SQUARE_SCORES
+        eg_scores = self.EG_SQUARE_SCORES
+        if flag in self.PROMOTION_FLAGS:
             self.piece_bitboards[piece_id] ^= toBB
-            if flag in [self.BISHOP_PROMOTION, self.BISHOP_PROMOTION_CAPTURE]:
-                self.piece_bitboards[self.BISHOP_ID] ^= toBB
-            elif flag in [self.KNIGHT_PROMOTION, self.KNIGHT_PROMOTION_CAPTURE]:
-                self.piece_bitboards[self.KNIGHT_ID] ^= toBB
-            elif flag in [self.QUEEN_PROMOTION, self.QUEEN_PROMOTION_CAPTURE]:
-                self.piece_bitboards[self.QUEEN_ID] ^= toBB
-            elif flag in [self.ROOK_PROMOTION, self.ROOK_PROMOTION_CAPTURE]:
-                self.piece_bitboards[self.ROOK_ID] ^= toBB
+            self.piece_bitboards[self.PAWN_ID] ^= toBB
+            self.mg_score += mg_scores[side][self.PAWN_ID][to_pos] - mg_scores[side][piece_id][to_pos]
+            self.eg_score += eg_scores[side][self.PAWN_ID][to_pos] - eg_scores[side][piece_id][to_pos]
+            self.game_phase -= self.GAMEPHASE_INC[piece_id]
+            piece_id = self.PAWN_ID
+            square = (side << self.MAILBOX_SIDE_SHIFT) | self.PAWN_ID
+        
+        # Reset quiet moves
+        self.piece_bitboards[piece_id] ^= fromToBB
+        self.side_bitboards[side] ^= fromToBB
+        self.mailbox[from_pos] = square
+        self.mailbox[to_pos] = self.EMPTY_ID
+        self.mg_score += mg_scores[side][piece_id][from_pos] - mg_scores[side][piece_id][to_pos]
+        self.eg_score += eg_scores[side][piece_id][from_pos] - eg_scores[side][piece_id][to_pos]
                 
         # Then undo captures
-        if flag in [self.CAPTURE, self.BISHOP_PROMOTION_CAPTURE, self.KNIGHT_PROMOTION_CAPTURE, self.QUEEN_PROMOTION_CAPTURE, self.ROOK_PROMOTION_CAPTURE]:
-            # Find id and color of captured piece
-            captured_piece_id = -1
-            for id, bb in enumerate(self.piece_bitboards):
-                if toBB & bb:
-                    captured_piece_id = id
-                    break
-            
+        if flag in self.CAPTURE_FLAGS:
             # Captured side is opposite of taking side
             captured_side = 1 - side
             
             self.piece_bitboards[captured_piece_id] ^= toBB
             self.side_bitboards[captured_side] ^= toBB
+            self.mailbox[to_pos] = (captured_side << self.MAILBOX_SIDE_SHIFT) | captured_piece_id
+            self.mg_score += mg_scores[captured_side][captured_piece_id][to_pos]
+            self.eg_score += eg_scores[captured_side][captured_piece_id][to_pos]
+            self.game_phase += self.GAMEPHASE_INC[captured_piece_id]
         
-        elif flag in [self.EP_CAPTURE]:
+        elif flag == self.EP_CAPTURE:
             if side == self.WHITE_SIDE:
-                capturedBB = np.uint64(1) << (to_pos - self.BOARD_WIDTH)
+                captured_pos = to_pos - self.BOARD_WIDTH
             elif side == self.BLACK_SIDE:
-                capturedBB = np.uint64(1) << (to_pos + self.BOARD_WIDTH)
+                captured_pos = to_pos + self.BOARD_WIDTH
+            capturedBB = self.ONE << captured_pos
                 
             captured_side = 1 - side
             # We know that the captured piece must be a pawn
             self.piece_bitboards[self.PAWN_ID] ^= capturedBB
             self.side_bitboards[captured_side] ^= capturedBB
-                
-        # Reset quiet moves
-        self.piece_bitboards[piece_id] ^= fromToBB
-        self.side_bitboards[side] ^= fromToBB
+            self.mailbox[captured_pos] = (captured_side << self.MAILBOX_SIDE_SHIFT) | self.PAWN_ID
+            self.mg_score += mg_scores[captured_side][self.PAWN_ID][captured_pos]
+            self.eg_score += eg_scores[captured_side][self.PAWN_ID][captured_pos]
+        
+        if self.debug_hash:
+            self.verify_hash()
+        if self.debug_eval:
+            self.verify_evaluation()
 
+    def make_null_move(self):
+        """Pass the turn to the other side, for null move pruning. Must be undone with unmake_null_move."""
+        self.push_undo_record(self.EMPTY_ID)
+        # No piece moves, so the attack maps still hold
+        slot = 2 * (self.ply - 1)
+        self.attack_maps[0] = self.attack_stack[slot]
+        self.attack_maps[1] = self.attack_stack[slot + 1]
+        self.hash ^= zobrist.SIDE_KEY ^ zobrist.EN_PASSANT_KEYS[self.en_passant_square]
+        self.en_passant_square = self.NULL_POSITION
+        self.halfmove_clock += 1
+        self.side_to_move = 1 - self.side_to_move
     
-    # HELPER FUNCTIONS
-    def generate_magic_index(self, blockers: np.uint64, magic_number: np.uint64, index_number: np.uint64, offset: np.uint64) -> np.uint64:
-        return (blockers * magic_number) >> (index_number) + offset
+    def unmake_null_move(self):
+        self.pop_undo_record()
+        self.side_to_move = 1 - self.side_to_move
+    
+    def push_undo_record(self, captured_piece_id: int):
+        """Save the state make_move is about to overwrite, along with the piece it captures."""
+        if self.ply == len(self.undo_stack):
+            self.undo_stack.extend(array("L", [0]) * self.UNDO_STACK_SIZE)
+            self.hash_stack.extend(array("Q", [0]) * self.UNDO_STACK_SIZE)
+            self.pawn_hash_stack.extend(array("Q", [0]) * self.UNDO_STACK_SIZE)
+            self.attack_stack.extend([None] * (2 * self.UNDO_STACK_SIZE))
+        self.hash_stack[self.ply] = self.hash
+        self.pawn_hash_stack[self.ply] = self.pawn_hash
+        attack_maps = self.attack_maps
+        slot = 2 * self.ply
+        self.attack_stack[slot] = attack_maps[0]
+        self.attack_stack[slot + 1] = attack_maps[1]
+        attack_maps[0] = attack_maps[1] = None
+        self.undo_stack[self.ply] = (self.castling_rights
+                                     | (self.en_passant_square << self.UNDO_EP_SHIFT)
+                                     | (captured_piece_id << self.UNDO_CAPTURED_SHIFT)
+                                     | (self.halfmove_clock << self.UNDO_HALFMOVE_SHIFT))
+        self.ply += 1
+    
+    def pop_undo_record(self) -> int:
+        """Restore the state saved by push_undo_record, and return the captured piece id."""
+        self.ply -= 1
+        record = self.undo_stack[self.ply]
+        self.hash = self.hash_stack[self.ply]
+        self.pawn_hash = self.pawn_hash_stack[self.ply]
+        slot = 2 * self.ply
+        self.attack_maps[0] = self.attack_stack[slot]
+        self.attack_maps[1] = self.attack_stack[slot + 1]
+        self.castling_rights = record & self.ALL_CASTLING_RIGHTS
+        self.en_passant_square = (record >> self.UNDO_EP_SHIFT) & 0x7F
+        self.halfmove_clock = record >> self.UNDO_HALFMOVE_SHIFT
+        return (record >> self.UNDO_CAPTURED_SHIFT) & self.MAILBOX_PIECE_MASK
+    
+    def compute_hash(self) -> int:
+        """Compute the Zobrist key of the position from scratch."""
+        key = zobrist.CASTLING_KEYS[self.castling_rights] ^ zobrist.EN_PASSANT_KEYS[self.en_passant_square]
+        if self.side_to_move == self.BLACK_SIDE:
+            key ^= zobrist.SIDE_KEY
+        for position, square in enumerate(self.mailbox):
+            if square != self.EMPTY_ID:
+                key ^= zobrist.PIECE_KEYS[square >> self.MAILBOX_SIDE_SHIFT][square & self.MAILBOX_PIECE_MASK][position]
+        return key
+    
+    def compute_pawn_hash(self) -> int:
+        """Compute the Zobrist key of the pawns alone from scratch."""
+        key = 0
+        for position, square in enumerate(self.mailbox):
+            if square & self.MAILBOX_PIECE_MASK == self.PAWN_ID:
+                key ^= zobrist.PIECE_KEYS[square >> self.MAILBOX_SIDE_SHIFT][self.PAWN_ID][position]
+        return key
+    
+    def verify_hash(self):
+        if self.hash != self.compute_hash():
+            raise Exception(f"Zobrist hash out of sync after {[int(move) for move in self.move_history]}")
+        if self.pawn_hash != self.compute_pawn_hash():
+            raise Exception(f"Pawn hash out of sync after {[int(move) for move in self.move_history]}")
     
-    def generate_magic_table(self, deltas, size, data: npt.NDArray):
-        table = np.empty(size)
+    def encode_game(self) -> tuple[tuple, list]:
+        """Return the encoding of the position before move_history, and move_history.
         
-        for position in range(self.BOARD_AREA):
-            magic_data = data[position]
-            rays = magic_data.mask
-            
-            blockers = np.uint64(0)
-            
-            # Loop through all subsets
-            while True:
-                possible_rays = self.generate_piece_rays(deltas, blockers, position)
-                table[self.generate_magic_index(blockers, magic_data.magic, magic_data.index_number, magic_data.offset)] = possible_rays
-                blockers = (blockers - rays) & rays
-                
-                if blockers == 0:
-                    break
+        Replaying the moves on a board made from_encoding() rebuilds this one along with the
+        history is_repetition() needs, which the encoding of the current position alone loses."""
+        moves = list(self.move_history)
+        for _ in moves:
+            self.unmake_move()
+        start_encoding = self.encode_position()
+        for move in moves:
+            self.make_move(move)
+        return start_encoding, [int(move) for move in moves]
+    
+    def is_repetition(self) -> bool:
+        """Return True if this position has already come up since the last capture or pawn move."""
+        # hash_stack[i] is the key before the i-th move - only every other one has the same side to move
+        earliest = max(0, self.ply - self.halfmove_clock)
+        for index in range(self.ply - 2, earliest - 1, -2):
+            if self.hash_stack[index] == self.hash:
+                return True
+        return False
+    
+    # EVALUATION
+    
+    def evaluate(self) -> int:
+        """Return the tapered PeSTO score in centipawns, from the side to move's point of view."""
+        mg_phase = min(self.game_phase, self.MAX_GAME_PHASE)
+        score = (self.mg_score * mg_phase + self.eg_score * (self.MAX_GAME_PHASE - mg_phase)) // self.MAX_GAME_PHASE
+        return score if self.side_to_move == self.WHITE_SIDE else -score
+    
+    def compute_evaluation(self) -> tuple[int, int, int]:
+        """Compute (mg_score, eg_score, game_phase) from scratch."""
+        mg_score = 0
+        eg_score = 0
+        game_phase = 0
+        for position, square in enumerate(self.mailbox):
+            if square != self.EMPTY_ID:
+                side = square >> self.MAILBOX_SIDE_SHIFT
+                piece_id = square & self.MAILBOX_PIECE_MASK
+                mg_score += self.MG_SQUARE_SCORES[side][piece_id][position]
+                eg_score += self.EG_SQUARE_SCORES[side][piece_id][position]
+                game_phase += self.GAMEPHASE_INC[piece_id]
+        return mg_score, eg_score, game_phase
+    
+    def verify_evaluation(self):
+        if (self.mg_score, self.eg_score, self.game_phase) != self.compute_evaluation():
+            raise Exception(f"Incremental evaluation out of sync after {[int(move) for move in self.move_history]}")
+    
+    def update_castling_scores(self, side: int, king_pos: int, rook_pos: int, direction: int):
+        """Add (direction 1) or take back (direction -1) the score change of castling with the rook on rook_pos."""
+        king_to, rook_to = self.CASTLING_SQUARES[rook_pos]
+        mg_king = self.MG_SQUARE_SCORES[side][self.KING_ID]
+        eg_king = self.EG_SQUARE_SCORES[side][self.KING_ID]
+        mg_rook = self.MG_SQUARE_SCORES[side][self.ROOK_ID]
+        eg_rook = self.EG_SQUARE_SCORES[side][self.ROOK_ID]
+        self.mg_score += direction * (mg_king[king_to] - mg_king[king_pos] + mg_rook[rook_to] - mg_rook[rook_pos])
+        self.eg_score += direction * (eg_king[king_to] - eg_king[king_pos] + eg_rook[rook_to] - eg_rook[rook_pos])
+    
+    def castle_pieces(self, side: int, king_pos: int, rook_pos: int):
+        """Move king and rook to their castled squares, or back again if they are already there."""
+        king_to, rook_to = self.CASTLING_SQUARES[rook_pos]
+        kingFromToBB = (self.ONE << king_pos) ^ (self.ONE << king_to)
+        rookFromToBB = (self.ONE << rook_pos) ^ (self.ONE << rook_to)
         
-        return table
+        self.piece_bitboards[self.KING_ID] ^= kingFromToBB
+        self.piece_bitboards[self.ROOK_ID] ^= rookFromToBB
+        self.side_bitboards[side] ^= kingFromToBB | rookFromToBB
+        
+        # Swap the mailbox squares - whichever end is empty is where the piece goes
+        self.mailbox[king_pos], self.mailbox[king_to] = self.mailbox[king_to], self.mailbox[king_pos]
+        self.mailbox[rook_pos], self.mailbox[rook_to] = self.mailbox[rook_to], self.mailbox[rook_pos]
 
-    def generate_piece_rays(self, deltas: tuple[int, int], blockers: np.uint64, position: int) -> np.uint64:
-        final = np.uint64(0)
-        for delta in deltas:
-            ray = np.uint64(1) << np.uint64(position)
-            while not (ray & blockers):
-                if self.is_bit_colliding_with_border(ray, delta):
-                    break
-                    
-                if ray & blockers:
-                    break
-                if delta[0] > 0:
-                    ray <<= delta[0]
-                elif delta[0] < 0:
-                    ray >>= abs(delta[0])
-                
-                if delta[1] > 0:
-                    ray <<= (self.BOARD_WIDTH * delta[1])
-                elif delta[1] < 0:
-                    ray >>= abs(self.BOARD_WIDTH * delta[1])
-                
-                final |= ray
+    
+    # PERFT
+    def perft(self, depth: int, cache: dict = None) -> int:
+        """Count the leaf nodes of the legal move tree, depth plies from this position.
+        
+        The last ply is bulk counted - its moves are generated but never made. Pass a dict as
+        cache to reuse the counts of subtrees reached by transposition, keyed by (hash, depth)."""
+        if depth <= 0:
+            return 1
+        if depth == 1:
+            return len(self.generate_legal_moves())
+        
+        if cache is not None:
+            nodes = cache.get((self.hash, depth))
+            if nodes is not None:
+                return nodes
         
-        return final
+        nodes = 0
+        for move in self.generate_legal_moves():
+            self.make_move(move)
+            nodes += self.perft(depth - 1, cache)
+            self.unmake_move()
+        
+        if cache is not None:
+            cache[(self.hash, depth)] = nodes
+        return nodes
+    
+    def divide(self, depth: int, cache: dict = None, report: bool = True, workers: int = 1, split_depth: int = 1) -> dict:
+        """Return {move name: perft count below it} for every root move, printing the split, total and nodes/s.
+        
+        With workers > 1 the tree is split split_depth plies below the root and the subtrees are
+        counted in parallel by a process pool. Each worker then keeps its own cache if one is passed."""
+        start = time.perf_counter()
+        if workers > 1 and depth > 1:
+            counts = self.parallel_divide(depth, workers, split_depth, cache is not None)
+        else:
+            counts = {}
+            for move in self.generate_legal_moves():
+                self.make_move(move)
+                counts[self.move_to_string(move)] = self.perft(depth - 1, cache)
+                self.unmake_move()
+        
+        if report:
+            self.print_divide(counts, time.perf_counter() - start)
+        return counts
+    
+    def parallel_divide(self, depth: int, workers: int, split_depth: int = 1, use_cache: bool = False) -> dict:
+        # Root moves alone are too few tasks to keep many cores busy, so splitting 2 plies down balances better
+        split_depth = max(1, min(split_depth, depth - 1))
+        counts = {self.move_to_string(move): 0 for move in self.generate_legal_moves()}
+        tasks = []
+        self.collect_split_positions(split_depth, None, tasks)
+        
+        names = [name for name, _ in tasks]
+        encodings = [encoding for _, encoding in tasks]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(perft_worker, itertools.repeat(type(self)), encodings, itertools.repeat(depth - split_depth), itertools.repeat(use_cache))
+            for name, nodes in zip(names, results):
+                counts[name] += nodes
+        return counts
+    
+    def collect_split_positions(self, plies: int, root_name: str, tasks: list):
+        """Append (root move name, encoded position) for every position plies below this one."""
+        for move in self.generate_legal_moves():
+            name = root_name if root_name is not None else self.move_to_string(move)
+            self.make_move(move)
+            if plies == 1:
+                tasks.append((name, self.encode_position()))
+            else:
+                self.collect_split_positions(plies - 1, name, tasks)
+            self.unmake_move()
+    
+    def print_divide(self, counts: dict, seconds: float):
+        for name, nodes in sorted(counts.items()):
+            print(f"{name}: {nodes}")
+        total = sum(counts.values())
+        print(f"\nMoves: {len(counts)}\nNodes: {total}\nTime: {seconds:.3f}s ({total / seconds if seconds else 0:.0f} nodes/s)")
+    
+    # HELPER FUNCTIONS
+    def generate_magic_index(self, blockers: np.uint64, magic_number: int, index_number: int, offset: int) -> int:
+        return magictables.magic_index(int(blockers), magic_number, index_number, offset)
     
     def display_bitboard(self, val):
         bbstring = self.format_bitboard(bin(val)[2:])
@@ -673,71 +1190,821 @@ class Board:
         # Return bitboard string with empty 0s filled in at the back
         return (self.BOARD_AREA - len(bb)) * "0" + bb
 
-    def is_bit_colliding_with_border(self, ray, delta):
-        # Check borders
-        if delta[0] < 0:
-            if ray & self.RIGHT_BORDER:
-                return True
-        elif delta[0] > 0:
-            if ray & self.LEFT_BORDER:
-                return True
-            
-        if delta[1] < 0:
-            if ray & self.FIRST_RANK:
-                return True
-        elif delta[1] > 0:
-            if ray & self.EIGTH_RANK:
-                return True
+    def encode_move(self, flag: int, from_pos: int, to_pos: int) -> np.uint16:
+        return np.uint16((flag << 12) | (from_pos << 6) | to_pos)
+    
+    def decode_move(self, encoded_move: np.uint16):
+        encoded_move = int(encoded_move)
+        flag = encoded_move >> 12
+        from_pos = (encoded_move >> 6) & 0x3F
+        to_pos = encoded_move & 0x3F
+        return flag, from_pos, to_pos
+    
+    def square_name(self, index: int) -> str:
+        return self.FILE_NAMES[index % self.BOARD_WIDTH] + str(index // self.BOARD_WIDTH + 1)
+    
+    def square_index(self, name: str) -> int:
+        """Return the bit index of a square name like e4."""
+        if len(name) != 2 or name[0] not in self.FILE_NAMES or name[1] not in "12345678":
+            raise Exception(f"Invalid square name: {name!r}")
+        return (int(name[1]) - 1) * self.BOARD_WIDTH + self.FILE_NAMES.index(name[0])
+    
+    def parse_san(self, san: str) -> np.uint16:
+        """Return the legal move written in standard algebraic notation (e.g. Nf3, exd5, O-O, e8=Q+).
         
-        return False
+        Raises if no legal move, or more than one, matches."""
+        text = san.rstrip("+#!?")
+        legal_moves = self.generate_legal_moves()
         
-    
-    def encode_move(self, flag: int, from_pos: int | np.uint64, to_pos: int | np.uint64) -> np.uint16:
-        if type(from_pos) == np.uint64:
-            from_pos = self.return_lsb_position(from_pos)
-        if type(to_pos) == np.uint64:
-            to_pos = self.return_lsb_position(to_pos)
+        if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+            flag = self.KING_CASTLE if len(text) == 3 else self.QUEEN_CASTLE
+            candidates = [move for move in legal_moves if int(move) >> 12 == flag]
+        else:
+            promotion_id = None
+            if "=" in text:
+                text, letter = text.split("=", 1)
+                promotion_id = self.PIECE_LETTERS.find(letter.lower())
+            elif len(text) > 2 and text[-1] in "QRBN" and text[-2] in "18":
+                # Promotion written without the '='
+                promotion_id = self.PIECE_LETTERS.find(text[-1].lower())
+                text = text[:-1]
+            
+            # Upper case letters are pieces, lower case b is always a file
+            piece_id = self.PAWN_ID
+            if text and text[0] in "KQRBN":
+                piece_id = self.PIECE_LETTERS.find(text[0].lower())
+                text = text[1:]
+            text = text.replace("x", "").replace("-", "")
+            if len(text) < 2:
+                raise Exception(f"Invalid SAN move: {san!r}")
+            to_pos = self.square_index(text[-2:])
+            disambiguation = text[:-2]
+            
+            candidates = []
+            for move in legal_moves:
+                flag, from_pos, move_to_pos = self.decode_move(move)
+                if (move_to_pos != to_pos or flag == self.KING_CASTLE or flag == self.QUEEN_CASTLE
+                        or self.mailbox[from_pos] & self.MAILBOX_PIECE_MASK != piece_id
+                        or self.PROMOTION_FLAGS.get(flag) != promotion_id):
+                    continue
+                from_name = self.square_name(from_pos)
+                if all(character in from_name for character in disambiguation):
+                    candidates.append(move)
         
-        return np.uint16((flag << 12) + (from_pos << 6) + to_pos)
+        if len(candidates) != 1:
+            raise Exception(f"{'Ambiguous' if candidates else 'Illegal'} SAN move {san!r} in {self.to_fen()}")
+        return candidates[0]
     
-    def decode_move(self, encoded_move: np.uint16):
-        from_pos = encoded_move >> 12
-        to_pos = (encoded_move << 4) >> 10
-        flag = (encoded_move << 10) >> 10
-        return flag, from_pos, to_pos
+    def move_to_string(self, move: np.uint16) -> str:
+        """Return the move in coordinate notation (e.g. e2e4, e7e8q). Castling is written as the king's move."""
+        flag, from_pos, to_pos = self.decode_move(move)
+        if flag == self.KING_CASTLE or flag == self.QUEEN_CASTLE:
+            to_pos = self.CASTLING_SQUARES[to_pos][0]
+        name = self.square_name(from_pos) + self.square_name(to_pos)
+        if flag in self.PROMOTION_FLAGS:
+            name += self.PIECE_LETTERS[self.PROMOTION_FLAGS[flag]]
+        return name
     
-    def return_lsb_position(self, bitboard):
+    def return_lsb_position(self, bitboard) -> int:
         """Return position of least significant bit in a bitboard."""
         
         index = bit_scan1(int(bitboard))
         
         if index != None: 
-            return np.uint64(index)
+            return index
         else:
-            return np.uint64(self.NULL_POSITION)
+            return self.NULL_POSITION
     
     def display_board(self):
-        for row in range(self.BOARD_HEIGHT):
-            for piece in range(self.BOARD_WIDTH):
-                piece_BB = np.uint64(1) << piece
-                if piece_BB & self.side_bitboards[self.WHITE_SIDE]:
-                    for id, bb in enumerate(self.piece_bitboards):
-                        if piece_BB & bb:
-                            print(self.WHITE_ICONS[id], end = " ")
-                            break
-                elif piece_BB & self.side_bitboards[self.BLACK_SIDE]:
-                    for id, bb in enumerate(self.piece_bitboards):
-                        if piece_BB & bb:
-                            print(self.WHITE_ICONS[id], end = " ")
-                            break
-                else:
+        # Top row first, and the most significant bit of each row is on the left
+        for row in reversed(range(self.BOARD_HEIGHT)):
+            for column in reversed(range(self.BOARD_WIDTH)):
+                square = self.mailbox[row * self.BOARD_WIDTH + column]
+                if square == self.EMPTY_ID:
                     print(self.EMPTY_ICON, end = " ")
+                elif square >> self.MAILBOX_SIDE_SHIFT == self.WHITE_SIDE:
+                    print(self.WHITE_ICONS[square & self.MAILBOX_PIECE_MASK], end = " ")
+                else:
+                    print(self.BLACK_ICONS[square & self.MAILBOX_PIECE_MASK], end = " ")
             
             print()
         
+class IntBoard(Board):
+    """Board backend that keeps its side and piece bitboards as plain Python ints.
+    
+    Same public API as Board, but every bitboard operation stays on Python ints instead
+    of NumPy scalars, which is several times faster in the interpreter. Bitboards never
+    grow past 64 bits, as nothing is ever shifted past the top row."""
+    
+    ONE = 1
+    ZERO = 0
+    
+    KNIGHT_TABLE = lookuptables.KNIGHT_TABLE[::-1]
+    KING_TABLE = lookuptables.KING_TABLE[::-1]
+    PAWN_ATTACK_TABLE = [lookuptables.WHITE_PAWN_ATTACKS, lookuptables.BLACK_PAWN_ATTACKS]
+    ROOK_RAYS = lookuptables.ROOK_RAYS
+    BISHOP_RAYS = lookuptables.BISHOP_RAYS
+    BETWEEN_TABLE = lookuptables.BETWEEN_TABLE
+    
+    def setup_magic_tables(self):
+        # Same shared tables, converted to lists of ints once per process
+        return magictables.get_magic_lists()
+    
+    def setup_bitboards(self):
+        side_bitboards, piece_bitboards = super().setup_bitboards()
+        return [int(bb) for bb in side_bitboards], [int(bb) for bb in piece_bitboards]
+    
+    def generate_magic_index(self, blockers: int, magic_number: int, index_number: int, offset: int) -> int:
+        return (((blockers * magic_number) & self.FULL_BITBOARD) >> index_number) + offset
+    
+    def encode_move(self, flag: int, from_pos: int, to_pos: int) -> int:
+        return (flag << 12) | (from_pos << 6) | to_pos
+    
+    def return_lsb_position(self, bitboard: int) -> int:
+        """Return position of least significant bit in a bitboard."""
+        
+        # bitboard & -bitboard isolates the lowest set bit
+        if bitboard:
+            return (bitboard & -bitboard).bit_length() - 1
+        else:
+            return self.NULL_POSITION
+
+# FEN
+
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+def parse_fen(fen: str) -> tuple[tuple, int]:
+    """Return (Board.encode_position() tuple, fullmove number) for a FEN.
+    
+    The halfmove clock and fullmove number may be left off, as they are in EPD."""
+    fields = fen.split()
+    if len(fields) < 4:
+        raise Exception(f"Invalid FEN, expected at least 4 fields: {fen!r}")
+    
+    side_bitboards = [0, 0]
+    piece_bitboards = [0] * 6
+    rows = fields[0].split("/")
+    if len(rows) != Board.BOARD_HEIGHT:
+        raise Exception(f"Invalid FEN, expected 8 ranks: {fen!r}")
+    for row_number, row in enumerate(rows):
+        rank = Board.BOARD_HEIGHT - 1 - row_number
+        file = 0
+        for character in row:
+            if character.isdigit():
+                file += int(character)
+                continue
+            piece_id = Board.PIECE_LETTERS.find(character.lower())
+            if piece_id == -1 or file >= Board.BOARD_WIDTH:
+                raise Exception(f"Invalid FEN, bad rank {row!r}: {fen!r}")
+            position = 1 << (rank * Board.BOARD_WIDTH + Board.BOARD_WIDTH - 1 - file)
+            side_bitboards[Board.WHITE_SIDE if character.isupper() else Board.BLACK_SIDE] |= position
+            piece_bitboards[piece_id] |= position
+            file += 1
+        if file != Board.BOARD_WIDTH:
+            raise Exception(f"Invalid FEN, bad rank {row!r}: {fen!r}")
+    
+    # Move generation relies on these, so positions breaking them are refused here rather than crashing later
+    if piece_bitboards[Board.PAWN_ID] & (Board.FIRST_RANK | Board.EIGTH_RANK):
+        raise Exception(f"Invalid FEN, pawn on the first or last rank: {fen!r}")
+    for side_bitboard in side_bitboards:
+        if (side_bitboard & piece_bitboards[Board.KING_ID]).bit_count() != 1:
+            raise Exception(f"Invalid FEN, each side needs exactly one king: {fen!r}")
+    
+    if fields[1] not in ("w", "b"):
+        raise Exception(f"Invalid FEN, bad side to move: {fen!r}")
+    side_to_move = Board.WHITE_SIDE if fields[1] == "w" else Board.BLACK_SIDE
+    
+    castling_rights = 0
+    if fields[2] != "-":
+        for letter in fields[2]:
+            for right, right_letter in Board.CASTLING_LETTERS.items():
+                if letter == right_letter:
+                    castling_rights |= right
+                    break
+            else:
+                raise Exception(f"Invalid FEN, bad castling rights: {fen!r}")
+    
+    en_passant_square = Board.NULL_POSITION
+    if fields[3] != "-":
+        if len(fields[3]) != 2 or fields[3][0] not in Board.FILE_NAMES or fields[3][1] not in "36":
+            raise Exception(f"Invalid FEN, bad en passant square: {fen!r}")
+        en_passant_square = (int(fields[3][1]) - 1) * Board.BOARD_WIDTH + Board.FILE_NAMES.index(fields[3][0])
+    
+    halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+    fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+    
+    encoding = tuple(side_bitboards) + tuple(piece_bitboards) + (side_to_move, castling_rights, en_passant_square, halfmove_clock)
+    return encoding, fullmove_number
+
+# Subtree counts kept by each perft worker process across all the tasks it is given
+_worker_perft_cache = {}
+
+def perft_worker(board_class: type, encoding: tuple, depth: int, use_cache: bool) -> int:
+    """Run perft on an encoded position. Module level so that ProcessPoolExecutor can pickle it."""
+    board = board_class.from_encoding(encoding)
+    return board.perft(depth, _worker_perft_cache if use_cache else None)
+
+@dataclass
+class SearchIteration:
+    depth: int
+    score: int
+    nodes: int
+    time_ms: float
+    pv: list
+    # Share of beta cutoffs caused by the first move searched - the closer to 1, the better the move ordering
+    first_move_cutoff_rate: float
+
+@dataclass
+class SearchResult:
+    move: int
+    score: int
+    pv: list
+    nodes: int
+    iterations: list
+    # Node counts for null move pruning, LMR and futility pruning, see ChessAI.new_pruning_stats
+    pruning_stats: dict
+
+def smp_worker(board_class: type, start_encoding: tuple, moves: list, table_name: str, hash_mb: int,
+               age: int, helper_id: int, limits: tuple, stop_event, results):
+    """Lazy SMP helper process - rebuild the game, search it with the shared table, and send back the result."""
+    board = board_class.from_encoding(start_encoding)
+    for move in moves:
+        board.make_move(move)
+    table = transposition.TranspositionTable.attach_shared(table_name, hash_mb)
+    table.age = age
+    
+    ai = ChessAI(board, transposition_table=table)
+    ai.helper_id = helper_id
+    ai.time_manager = timemanager.TimeManager(stop_event)
+    results.put(ai.search(*limits))
+    ai.close()
+
 class ChessAI:
-    def __init__(self, board):
+    MAX_PLY = 64
+    DEFAULT_DEPTH = 4
+    INFINITY = 32000
+    # Mate scores count down by one per ply, so anything past MATE_BOUND is a forced mate
+    MATE_SCORE = 30000
+    MATE_BOUND = MATE_SCORE - MAX_PLY
+    # Tablebase wins score TABLEBASE_WIN - plies to mate, a band of their own below MATE_BOUND. They don't
+    # depend on the ply they were found at, so they go in the transposition table unadjusted.
+    TABLEBASE_WIN = MATE_BOUND - 1
+    
+    # Move ordering - the table move, then captures and good promotions, then killers, then quiet moves by history
+    TT_MOVE_SCORE = 1 << 30
+    CAPTURE_SCORE = 1 << 28
+    KILLER_SCORE = 1 << 27
+    # Capture ordering rank of each piece id (pawn, bishop, rook, knight, queen, king)
+    MVV_LVA_RANKS = [1, 3, 4, 2, 5, 6]
+    HISTORY_MAX = 1 << 24
+    
+    # Quiescence captures that can't lift the score to within DELTA_MARGIN of alpha are skipped
+    DELTA_MARGIN = 200
+    
+    # Selective search. Null move searches depth - 1 - NULL_MOVE_REDUCTION (one more above depth 6),
+    # LMR starts reducing from the LMR_MIN_MOVES-th move and reduces further from LMR_DEEP_MOVES on,
+    # and futility pruning uses FUTILITY_MARGINS[depth] for depths 1 and 2
+    NULL_MOVE_MIN_DEPTH = 3
+    NULL_MOVE_REDUCTION = 2
+    LMR_MIN_DEPTH = 3
+    LMR_MIN_MOVES = 3
+    LMR_DEEP_MOVES = 8
+    FUTILITY_MARGINS = [0, 200, 500]
+    
+    ASPIRATION_WINDOW = 50
+    ASPIRATION_MIN_DEPTH = 3
+    # How many nodes go by between checks of the clock
+    CHECK_INTERVAL = 1024
+    # How long to wait for a lazy SMP helper's result before checking it is still alive
+    HELPER_POLL_SECONDS = 0.1
+    
+    def __init__(self, board, hash_mb: int = 16, threads: int = 1, transposition_table: transposition.TranspositionTable = None,
+                 book = None, tablebases = None):
         self.board = board
+        # A book.OpeningBook - positions found in it are answered from the book without searching
+        self.book = book
+        # A tablebase.Tablebases - positions it covers are scored exactly, at the root and at every node
+        self.tablebases = tablebases
+        
+        # With more than one thread, search() runs lazy SMP: helper processes search the same position
+        # and share what they find through a transposition table in shared memory
+        self.threads = threads
+        self.helper_id = 0
+        if transposition_table is not None:
+            if threads > 1 and transposition_table.shared_memory is None:
+                raise Exception("Lazy SMP needs a shared transposition table - use TranspositionTable.create_shared()")
+            self.transposition_table = transposition_table
+        elif threads > 1:
+            self.transposition_table = transposition.TranspositionTable.create_shared(hash_mb)
+        else:
+            self.transposition_table = transposition.TranspositionTable(hash_mb)
+        # Pawn structure scores, shared by every position with the same pawns
+        self.pawn_table = pawnhash.PawnHashTable()
+        
+        # Triangular PV table - row ply holds the best line found from that ply, pv_length[ply] is where it ends
+        self.pv_table = [[0] * self.MAX_PLY for _ in range(self.MAX_PLY)]
+        self.pv_length = [0] * self.MAX_PLY
+        
+        # Two quiet moves per ply that last caused a beta cutoff there
+        self.killers = [[0, 0] for _ in range(self.MAX_PLY)]
+        # Quiet move scores indexed by [side, from, to], flattened so a move's low 12 bits index a side's row.
+        # Halved at the start of every search, so old results fade out.
+        self.history = np.zeros((2, Board.BOARD_AREA, Board.BOARD_AREA), dtype=np.int32)
+        self.history_flat = self.history.reshape(-1)
+        
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        
+        # Each selective search technique can be switched off, to measure what it is worth
+        self.use_null_move = True
+        self.use_lmr = True
+        self.use_futility = True
+        self.pruning_stats = self.new_pruning_stats()
+        
+        self.nodes = 0
+        self.node_limit = None
+        # Checked at every node, so it stays a plain bool - check_limits() sets it from the time manager,
+        # which is where other threads ask for a stop (see stop_search)
+        self.stop = False
+        self.time_manager = timemanager.TimeManager()
+        # Limits only apply once an iteration has finished, so there is always a move to return
+        self.can_stop = False
+    
+    def evaluate(self) -> int:
+        """Return the board's PeSTO score plus the pawn structure terms, from the side to move's point of view."""
+        board = self.board
+        mg_pawns, eg_pawns = self.pawn_table.probe(board)
+        mg_phase = min(board.game_phase, board.MAX_GAME_PHASE)
+        pawn_score = (mg_pawns * mg_phase + eg_pawns * (board.MAX_GAME_PHASE - mg_phase)) // board.MAX_GAME_PHASE
+        return board.evaluate() + (pawn_score if board.side_to_move == board.WHITE_SIDE else -pawn_score)
+    
+    # SEARCH
+    
+    def search(self, depth: int = None, time_ms: float = None, nodes: int = None,
+               remaining_ms: float = None, increment_ms: float = 0, moves_to_go: int = None) -> SearchResult:
+        """Search the board's position with iterative deepening until depth, time_ms or nodes runs out.
+        
+        Instead of a fixed time_ms, the remaining clock, increment and moves to go can be given and
+        the time manager works out how long to think. With no limits at all, searches to DEFAULT_DEPTH.
+        The result always comes from the last iteration that finished, so a search cut short by time,
+        nodes or stop_search() still returns a move."""
+        if self.book is not None and self.helper_id == 0:
+            book_move = self.book_move()
+            if book_move is not None:
+                return SearchResult(book_move, 0, [book_move], 0, [], {})
+        if self.tablebases is not None and self.helper_id == 0:
+            tablebase_result = self.tablebase_move()
+            if tablebase_result is not None:
+                return tablebase_result
+        
+        limits = (depth, time_ms, nodes, remaining_ms, increment_ms, moves_to_go)
+        if self.threads > 1 and self.helper_id == 0:
+            return self.lazy_smp_search(limits)
+        return self.iterative_deepening(*limits)
+    
+    def book_move(self):
+        """Return a book move for the position, or None. Book moves are checked against the legal moves,
+        so a key collision or a book built from a bad game can't make the AI play an illegal move."""
+        move = self.book.choose(self.board.hash)
+        if not move:
+            return None
+        for legal_move in self.board.generate_legal_moves():
+            if int(legal_move) == move:
+                return legal_move
+        return None
+    
+    def tablebase_move(self) -> SearchResult:
+        """Return the tablebase's best move - the fastest win, else a draw, else the slowest loss - or None
+        if the tablebases don't cover every move from the position."""
+        board = self.board
+        best_move = None
+        best_score = -self.INFINITY
+        for move in board.generate_legal_moves():
+            board.make_move(move)
+            score = self.tablebase_score()
+            board.unmake_move()
+            if score is None:
+                return None
+            score = -score
+            if score > best_score:
+                best_move, best_score = move, score
+        if best_move is None:
+            return None
+        return SearchResult(best_move, best_score, [best_move], 0, [], {})
+    
+    def tablebase_score(self) -> int:
+        """Return the exact score of the position from the tablebases, or None if they don't cover it."""
+        entry = self.tablebases.probe(self.board)
+        if entry is None:
+            return None
+        outcome, plies = entry
+        return outcome * (self.TABLEBASE_WIN - plies)
+    
+    def lazy_smp_search(self, limits: tuple) -> SearchResult:
+        """Search alongside threads - 1 helper processes, and return the deepest completed result among them."""
+        context = multiprocessing.get_context()
+        stop_event = context.Event()
+        results = context.Queue()
+        table = self.transposition_table
+        start_encoding, moves = self.board.encode_game()
+        # Every search ages the table by one - helpers start a step behind so they end up on the same age as us
+        helper_age = table.age
+        
+        helpers = [context.Process(target=smp_worker, daemon=True,
+                                   args=(type(self.board), start_encoding, moves, table.shared_memory.name, table.hash_mb,
+                                         helper_age, helper_id, limits, stop_event, results))
+                   for helper_id in range(1, self.threads)]
+        for helper in helpers:
+            helper.start()
+        
+        result = self.iterative_deepening(*limits)
+        # Helpers run until we are done, then all stop together
+        stop_event.set()
+        helper_results = []
+        while len(helper_results) < len(helpers):
+            try:
+                helper_results.append(results.get(timeout=self.HELPER_POLL_SECONDS))
+            except queue.Empty:
+                # A helper only exits cleanly after sending its result, so any other exit means it never will
+                if any(helper.exitcode not in (None, 0) for helper in helpers):
+                    for helper in helpers:
+                        helper.join(self.HELPER_POLL_SECONDS)
+                        if helper.is_alive():
+                            helper.terminate()
+                    return result
+        for helper in helpers:
+            helper.join()
+        
+        best = result
+        for helper_result in helper_results:
+            if helper_result.iterations and helper_result.iterations[-1].depth > (best.iterations[-1].depth if best.iterations else 0):
+                best = helper_result
+        best.nodes = result.nodes + sum(helper_result.nodes for helper_result in helper_results)
+        return best
+    
+    def iterative_deepening(self, depth: int = None, time_ms: float = None, nodes: int = None,
+                            remaining_ms: float = None, increment_ms: float = 0, moves_to_go: int = None) -> SearchResult:
+        timed = time_ms is not None or remaining_ms is not None
+        if depth is None:
+            depth = self.DEFAULT_DEPTH if not timed and nodes is None else self.MAX_PLY - 1
+        depth = min(depth, self.MAX_PLY - 1)
+        
+        self.time_manager.start(time_ms, remaining_ms, increment_ms, moves_to_go)
+        self.node_limit = nodes
+        self.nodes = 0
+        self.stop = False
+        self.can_stop = False
+        self.transposition_table.new_search()
+        self.history >>= 1
+        self.pruning_stats = self.new_pruning_stats()
+        for killers in self.killers:
+            killers[0] = killers[1] = 0
+        
+        legal_moves = self.board.generate_legal_moves()
+        result = SearchResult(int(legal_moves[0]) if legal_moves else 0, 0, [], 0, [], {})
+        if not legal_moves:
+            result.score = -self.MATE_SCORE if self.board.in_check(self.board.side_to_move) else 0
+            return result
+        
+        score = 0
+        for current_depth in range(1, depth + 1):
+            if current_depth > 1 and not self.time_manager.can_start_iteration():
+                break
+            # Lazy SMP helpers skip every other depth, offset by their id, so between them they work a few depths at once
+            if self.helper_id and 1 < current_depth < depth and (current_depth + self.helper_id) % 2:
+                continue
+            iteration_start_nodes = self.nodes
+            self.cutoffs = 0
+            self.first_move_cutoffs = 0
+            score = self.aspiration_search(current_depth, score)
+            if self.stop:
+                break
+            
+            pv = self.pv_table[0][:self.pv_length[0]]
+            result.move = pv[0] if pv else result.move
+            result.score = score
+            result.pv = pv
+            result.iterations.append(SearchIteration(current_depth, score, self.nodes - iteration_start_nodes,
+                                                     self.time_manager.elapsed_ms(), pv,
+                                                     self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0))
+            
+            self.can_stop = True
+            
+            # No point going deeper once a forced mate has been found
+            if abs(score) > self.MATE_BOUND:
+                break
+        
+        result.nodes = self.nodes
+        result.pruning_stats = dict(self.pruning_stats)
+        return result
+    
+    def aspiration_search(self, depth: int, previous_score: int) -> int:
+        """Search the root in a narrow window around the previous score, widening it whenever the score falls outside."""
+        if depth < self.ASPIRATION_MIN_DEPTH:
+            return self.negamax(depth, 0, -self.INFINITY, self.INFINITY)
+        
+        window = self.ASPIRATION_WINDOW
+        alpha = max(previous_score - window, -self.INFINITY)
+        beta = min(previous_score + window, self.INFINITY)
+        while True:
+            score = self.negamax(depth, 0, alpha, beta)
+            if self.stop:
+                return score
+            if score <= alpha:
+                alpha = max(score - window, -self.INFINITY)
+            elif score >= beta:
+                beta = min(score + window, self.INFINITY)
+            else:
+                return score
+            window *= 2
+    
+    def negamax(self, depth: int, ply: int, alpha: int, beta: int, allow_null: bool = True) -> int:
+        """Principal variation search - return the score of the position from the side to move's point of view."""
+        if depth <= 0:
+            return self.quiescence(ply, alpha, beta)
+        
+        board = self.board
+        table = self.transposition_table
+        self.pv_length[ply] = ply
+        
+        self.nodes += 1
+        if self.nodes % self.CHECK_INTERVAL == 0:
+            self.check_limits()
+        if self.stop:
+            return 0
+        
+        if ply > 0 and (board.halfmove_clock >= 100 or board.is_repetition()):
+            return 0
+        if ply >= self.MAX_PLY - 1:
+            return self.evaluate()
+        if self.tablebases is not None and ply > 0:
+            score = self.tablebase_score()
+            if score is not None:
+                return score
+        
+        # Only cut off on a table hit outside the principal variation, so the PV stays complete
+        pv_node = beta - alpha > 1
+        tt_move = 0
+        entry = table.probe(board.hash)
+        if entry is not None:
+            tt_move, tt_score, tt_depth, tt_bound = entry
+            if ply > 0 and not pv_node and tt_depth >= depth:
+                tt_score = self.score_from_table(tt_score, ply)
+                if (tt_bound == table.BOUND_EXACT
+                        or (tt_bound == table.BOUND_LOWER and tt_score >= beta)
+                        or (tt_bound == table.BOUND_UPPER and tt_score <= alpha)):
+                    return tt_score
+        
+        side = board.side_to_move
+        in_check = board.in_check(side)
+        static_eval = self.evaluate() if not in_check else -self.INFINITY
+        
+        # Null move pruning - if passing still leaves us above beta, a real move almost certainly would too.
+        # Not trusted with only pawns left, where having to move can be the worst thing that happens (zugzwang).
+        if (self.use_null_move and allow_null and not pv_node and not in_check and ply > 0
+                and depth >= self.NULL_MOVE_MIN_DEPTH and static_eval >= beta and self.has_non_pawn_material(side)):
+            self.pruning_stats["null_move_tries"] += 1
+            reduction = self.NULL_MOVE_REDUCTION + (depth > 6)
+            board.make_null_move()
+            score = -self.negamax(depth - 1 - reduction, ply + 1, -beta, -beta + 1, False)
+            board.unmake_null_move()
+            if self.stop:
+                return 0
+            if score >= beta:
+                self.pruning_stats["null_move_cutoffs"] += 1
+                # Don't return an unproven mate
+                return beta if score > self.MATE_BOUND else score
+        
+        moves = board.generate_legal_moves()
+        if not moves:
+            return -self.MATE_SCORE + ply if in_check else 0
+        scored_moves = self.order_moves(moves, ply, tt_move)
+        
+        # Futility pruning - close to the leaves, quiet moves can't make up a big enough deficit
+        futile = (self.use_futility and not pv_node and not in_check and depth <= len(self.FUTILITY_MARGINS) - 1
+                  and abs(alpha) < self.MATE_BOUND and static_eval + self.FUTILITY_MARGINS[depth] <= alpha)
+        
+        original_alpha = alpha
+        best_score = -self.INFINITY
+        best_move = 0
+        for index, (order_score, move) in enumerate(scored_moves):
+            quiet = move >> 12 < Board.CAPTURE
+            board.make_move(move)
+            gives_check = (futile or index >= self.LMR_MIN_MOVES) and quiet and board.in_check(board.side_to_move)
+            
+            if futile and index > 0 and quiet and not gives_check:
+                board.unmake_move()
+                self.pruning_stats["futility_pruned"] += 1
+                best_score = max(best_score, static_eval + self.FUTILITY_MARGINS[depth])
+                continue
+            
+            if index == 0:
+                score = -self.negamax(depth - 1, ply + 1, -beta, -alpha)
+            else:
+                # Late move reductions - quiet moves the ordering put late are searched shallower first,
+                # more so when the history table has nothing good to say about them
+                reduction = 0
+                if (self.use_lmr and quiet and not in_check and not gives_check
+                        and depth >= self.LMR_MIN_DEPTH and index >= self.LMR_MIN_MOVES and order_score < self.KILLER_SCORE):
+                    reduction = min(1 + (order_score <= 0) + (index >= self.LMR_DEEP_MOVES), depth - 2)
+                    self.pruning_stats["lmr_reductions"] += 1
+                
+                # Prove the move is no better than the first with a null window, and only search it fully if it is
+                score = -self.negamax(depth - 1 - reduction, ply + 1, -alpha - 1, -alpha)
+                if reduction and score > alpha:
+                    self.pruning_stats["lmr_researches"] += 1
+                    score = -self.negamax(depth - 1, ply + 1, -alpha - 1, -alpha)
+                if alpha < score < beta:
+                    score = -self.negamax(depth - 1, ply + 1, -beta, -alpha)
+            board.unmake_move()
+            
+            if self.stop:
+                return 0
+            
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    self.update_pv(ply, move)
+                    if score >= beta:
+                        self.record_cutoff(move, ply, depth, index)
+                        break
+        
+        if best_score >= beta:
+            bound = table.BOUND_LOWER
+        elif best_score > original_alpha:
+            bound = table.BOUND_EXACT
+        else:
+            bound = table.BOUND_UPPER
+        table.store(board.hash, depth, bound, self.score_to_table(best_score, ply), int(best_move))
+        return best_score
+    
+    def has_non_pawn_material(self, side: int) -> bool:
+        board = self.board
+        pieces = board.piece_bitboards
+        return bool(board.side_bitboards[side] & (pieces[Board.KNIGHT_ID] | pieces[Board.BISHOP_ID] | pieces[Board.ROOK_ID] | pieces[Board.QUEEN_ID]))
+    
+    def quiescence(self, ply: int, alpha: int, beta: int) -> int:
+        """Search captures only until the position is quiet, so the leaves aren't scored in the middle of an exchange."""
+        board = self.board
+        self.pv_length[ply] = ply
+        
+        self.nodes += 1
+        if self.nodes % self.CHECK_INTERVAL == 0:
+            self.check_limits()
+        if self.stop:
+            return 0
+        if ply >= self.MAX_PLY - 1:
+            return self.evaluate()
+        if self.tablebases is not None:
+            score = self.tablebase_score()
+            if score is not None:
+                return score
+        
+        # In check every evasion has to be looked at, and standing pat isn't an option
+        in_check = board.in_check(board.side_to_move)
+        if in_check:
+            moves = board.generate_legal_moves()
+            if not moves:
+                return -self.MATE_SCORE + ply
+            stand_pat = best_score = -self.INFINITY
+        else:
+            stand_pat = best_score = self.evaluate()
+            if stand_pat >= beta:
+                return stand_pat
+            if stand_pat > alpha:
+                alpha = stand_pat
+            moves = board.generate_legal_moves(captures_only=True)
+        
+        for _, move in self.order_moves(moves, ply, 0):
+            if not in_check and move >> 12 not in Board.PROMOTION_FLAGS:
+                # Delta pruning - even winning the piece outright wouldn't be enough
+                captured_piece_id = Board.PAWN_ID if move >> 12 == Board.EP_CAPTURE else board.mailbox[move & 0x3F] & Board.MAILBOX_PIECE_MASK
+                if stand_pat + Board.SEE_VALUES[captured_piece_id] + self.DELTA_MARGIN <= alpha:
+                    continue
+                # Captures that lose material once the recaptures are played out
+                if board.static_exchange(move) < 0:
+                    continue
+            
+            board.make_move(move)
+            score = -self.quiescence(ply + 1, -beta, -alpha)
+            board.unmake_move()
+            if self.stop:
+                return 0
+            
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    self.update_pv(ply, move)
+                    if score >= beta:
+                        break
+        return best_score
+    
+    # MOVE ORDERING
+    
+    def order_moves(self, moves: list, ply: int, tt_move: int) -> list:
+        """Return (ordering score, move) pairs sorted best first - see the *_SCORE constants for the order."""
+        mailbox = self.board.mailbox
+        history = self.history_flat
+        history_offset = self.board.side_to_move << 12
+        killer_1, killer_2 = self.killers[ply]
+        ranks = self.MVV_LVA_RANKS
+        
+        scored = []
+        for move in moves:
+            move = int(move)
+            flag = move >> 12
+            if move == tt_move:
+                score = self.TT_MOVE_SCORE
+            elif flag >= Board.CAPTURE:
+                # Promotions are ordered like captures, queen promotions first and underpromotions behind the rest
+                attacker = ranks[mailbox[(move >> 6) & 0x3F] & Board.MAILBOX_PIECE_MASK]
+                if flag in Board.CAPTURE_FLAGS:
+                    score = self.CAPTURE_SCORE + 8 * ranks[mailbox[move & 0x3F] & Board.MAILBOX_PIECE_MASK] - attacker
+                elif flag == Board.EP_CAPTURE:
+                    score = self.CAPTURE_SCORE + 8 * ranks[Board.PAWN_ID] - attacker
+                else:
+                    score = 0
+                if flag in Board.PROMOTION_FLAGS:
+                    score += self.CAPTURE_SCORE if Board.PROMOTION_FLAGS[flag] == Board.QUEEN_ID else -self.CAPTURE_SCORE
+            elif move == killer_1:
+                score = self.KILLER_SCORE + 1
+            elif move == killer_2:
+                score = self.KILLER_SCORE
+            else:
+                score = int(history[history_offset | (move & 0xFFF)])
+            scored.append((score, move))
+        
+        scored.sort(reverse=True)
+        return scored
+    
+    def record_cutoff(self, move: int, ply: int, depth: int, index: int):
+        """Count a beta cutoff, and remember the move in the killer and history tables if it was quiet."""
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+        
+        move = int(move)
+        if move >> 12 >= Board.CAPTURE:
+            return
+        
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        
+        history_index = (self.board.side_to_move << 12) | (move & 0xFFF)
+        self.history_flat[history_index] += depth * depth
+        if self.history_flat[history_index] > self.HISTORY_MAX:
+            self.history >>= 1
+    
+    def new_pruning_stats(self) -> dict:
+        return {
+            "null_move_tries": 0,
+            "null_move_cutoffs": 0,
+            "lmr_reductions": 0,
+            "lmr_researches": 0,
+            "futility_pruned": 0,
+        }
+    
+    def update_pv(self, ply: int, move: int):
+        """Make move followed by the child's line the best line from ply."""
+        child_length = self.pv_length[ply + 1]
+        row = self.pv_table[ply]
+        row[ply] = int(move)
+        row[ply + 1:child_length] = self.pv_table[ply + 1][ply + 1:child_length]
+        self.pv_length[ply] = max(child_length, ply + 1)
+    
+    def check_limits(self):
+        """Called every CHECK_INTERVAL nodes - stop if the nodes or time have run out, or a stop was asked for."""
+        if not self.can_stop:
+            return
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            self.stop = True
+        elif self.time_manager.poll():
+            self.stop = True
+    
+    def close(self):
+        """Free the shared transposition table of a multi-threaded ChessAI."""
+        self.transposition_table.close(unlink=self.helper_id == 0)
+    
+    def stop_search(self):
+        """Stop the running search as soon as it next checks its limits. Safe to call from another thread."""
+        self.time_manager.stop()
+    
+    def score_to_table(self, score: int, ply: int) -> int:
+        # Mate scores are stored as distance from this node rather than from the root
+        if score > self.MATE_BOUND:
+            return score + ply
+        if score < -self.MATE_BOUND:
+            return score - ply
+        return score
     
-    def evaluate(self):
-        pass
+    def score_from_table(self, score: int, ply: int) -> int:
+        if score > self.MATE_BOUND:
+            return score - ply
+        if score < -self.MATE_BOUND:
+            return score + ply
+        return score
@@ -0,0 +1,129 @@
+"""
+Pawn structure evaluation and the pawn hash table that caches it.
+
+Doubled, isolated and passed pawns depend on nothing but the pawns, which move far
+less often than anything else, so most leaves of a search share their pawn skeleton
+with thousands of others. The terms are computed set-wise on the pawn bitboards,
+and the result is stored under Board.pawn_hash - a Zobrist key of the pawns alone -
+in a fixed size table, so they are only worked out once per skeleton.
+"""
+
+import numpy as np
+
+FULL_BITBOARD = 0xFFFFFFFFFFFFFFFF
+# Bit 0 is h1, so shifting left moves towards the a file
+A_FILE = 0x8080808080808080
+H_FILE = 0x0101010101010101
+
+WHITE_SIDE = 0
+BLACK_SIDE = 1
+
+# (middlegame, endgame) penalties per pawn, and passed pawn bonuses by rank counted from the pawn's own side
+DOUBLED_PENALTY = (10, 20)
+ISOLATED_PENALTY = (10, 15)
+PASSED_BONUS_MG = [0, 5, 10, 15, 25, 45, 70, 0]
+PASSED_BONUS_EG = [0, 10, 15, 25, 45, 75, 120, 0]
+
+
+# SET-WISE TERMS
+
+def north_fill(bitboard: int) -> int:
+    bitboard |= bitboard << 8
+    bitboard |= bitboard << 16
+    bitboard |= bitboard << 32
+    return bitboard & FULL_BITBOARD
+
+def south_fill(bitboard: int) -> int:
+    bitboard |= bitboard >> 8
+    bitboard |= bitboard >> 16
+    bitboard |= bitboard >> 32
+    return bitboard
+
+def adjacent_files(bitboard: int) -> int:
+    """Return the squares one file to either side of every square in bitboard."""
+    return ((bitboard << 1) & ~H_FILE & FULL_BITBOARD) | ((bitboard >> 1) & ~A_FILE)
+
+def front_spans(pawns: int, side: int) -> int:
+    """Return every square in front of the pawns, from side's point of view."""
+    if side == WHITE_SIDE:
+        return north_fill(pawns) << 8 & FULL_BITBOARD
+    return south_fill(pawns) >> 8
+
+def doubled_pawns(pawns: int, side: int) -> int:
+    """Return the pawns with another pawn of their own in front of them."""
+    return pawns & front_spans(pawns, 1 - side)
+
+def isolated_pawns(pawns: int) -> int:
+    """Return the pawns with no pawn of their own on either neighbouring file."""
+    files = north_fill(pawns) | south_fill(pawns)
+    return pawns & ~adjacent_files(files)
+
+def passed_pawns(pawns: int, enemy_pawns: int, side: int) -> int:
+    """Return the pawns no enemy pawn can block or take on their way to promotion."""
+    enemy_spans = front_spans(enemy_pawns, 1 - side)
+    return pawns & ~(enemy_spans | adjacent_files(enemy_spans))
+
+def evaluate_pawns(white_pawns: int, black_pawns: int) -> tuple[int, int]:
+    """Return the (middlegame, endgame) pawn structure score, from white's point of view."""
+    mg_score = 0
+    eg_score = 0
+    for side, pawns, enemy_pawns, sign in ((WHITE_SIDE, white_pawns, black_pawns, 1),
+                                           (BLACK_SIDE, black_pawns, white_pawns, -1)):
+        doubled = doubled_pawns(pawns, side).bit_count()
+        isolated = isolated_pawns(pawns).bit_count()
+        mg_score -= sign * (doubled * DOUBLED_PENALTY[0] + isolated * ISOLATED_PENALTY[0])
+        eg_score -= sign * (doubled * DOUBLED_PENALTY[1] + isolated * ISOLATED_PENALTY[1])
+
+        passed = passed_pawns(pawns, enemy_pawns, side)
+        while passed:
+            square = (passed & -passed).bit_length() - 1
+            rank = square >> 3 if side == WHITE_SIDE else 7 - (square >> 3)
+            mg_score += sign * PASSED_BONUS_MG[rank]
+            eg_score += sign * PASSED_BONUS_EG[rank]
+            passed &= passed - 1
+    return mg_score, eg_score
+
+
+# CACHING
+
+class PawnHashTable:
+    def __init__(self, entries: int = 1 << 14):
+        # One always-replaced slot per index, picked with a mask, so entries is rounded down to a power of two
+        self.size = 1 << (max(entries, 1).bit_length() - 1)
+        self.mask = self.size - 1
+        # A key of 0 is the position without pawns, whose score really is (0, 0), so an empty table is never wrong
+        self.keys = np.zeros(self.size, dtype=np.uint64)
+        self.scores = np.zeros((self.size, 2), dtype=np.int16)
+        self.probes = 0
+        self.hits = 0
+
+    def clear(self):
+        self.keys.fill(0)
+        self.scores.fill(0)
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, board) -> tuple[int, int]:
+        """Return the board's (middlegame, endgame) pawn structure score from white's point of view, computing it on a miss."""
+        self.probes += 1
+        key = board.pawn_hash
+        index = key & self.mask
+        if self.keys[index] == key:
+            self.hits += 1
+            mg_score, eg_score = self.scores[index]
+            return int(mg_score), int(eg_score)
+
+        pawns = int(board.piece_bitboards[board.PAWN_ID])
+        mg_score, eg_score = evaluate_pawns(pawns & int(board.side_bitboards[WHITE_SIDE]),
+                                            pawns & int(board.side_bitboards[BLACK_SIDE]))
+        self.keys[index] = key
+        self.scores[index] = mg_score, eg_score
+        return mg_score, eg_score
+
+    def stats(self) -> dict:
+        return {
+            "entries": self.size,
+            "probes": self.probes,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.probes if self.probes else 0.0,
+        }
@@ -0,0 +1,299 @@
+"""
+Endgame tablebases for king and queen, king and rook, and king and pawn against a bare king.
+
+Every table is built by retrograde analysis: the legal moves of every position are
+generated once with newboard's move generator, and mates are then propagated
+backwards through them a ply at a time, so each position gets its exact distance
+to mate (DTM). A KPK promotion leads into the KQK or KRK table, so those are built
+first.
+
+Tables are uint8 arrays indexed by side to move, white king, black king and the
+white piece's square, always with white as the side that has the piece. Symmetry
+keeps the white king on the a-d files, and for pawnless tables also below the 5th
+rank and on or right of the a1-h8 diagonal. An entry is DRAW, INVALID for an
+impossible position, or else 1 + the number of plies until white mates.
+
+Building takes about a minute, so tables are written to TABLEBASE_DIR by running
+python tablebase.py, and Tablebases only loads the ones it finds there.
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import numpy.typing as npt
+
+import magictables
+import newboard
+
+TABLE_VERSION = 1
+TABLEBASE_DIR = os.environ.get("TABLEBASE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".tablebases"))
+
+Board = newboard.Board
+
+DRAW = 0
+INVALID = 255
+
+# Material -> piece id of white's extra piece, in the order they have to be built
+MATERIALS = {"KQK": Board.QUEEN_ID, "KRK": Board.ROOK_ID, "KPK": Board.PAWN_ID}
+MATERIAL_NAMES = {piece_id: material for material, piece_id in MATERIALS.items()}
+# Pieces that can't mate on their own, so a king and one of them against a king is a draw
+DRAWN_PIECES = (Board.BISHOP_ID, Board.KNIGHT_ID)
+
+BOARD_AREA = 64
+RANK_EDGES = Board.FIRST_RANK | Board.EIGTH_RANK
+
+
+# SYMMETRY
+
+def square_file(square: int) -> int:
+    # 0 is the a file - bit 0 is h1
+    return 7 - (square & 7)
+
+def square_rank(square: int) -> int:
+    return square >> 3
+
+def transpose(square: int) -> int:
+    """Mirror a square in the a1-h8 diagonal."""
+    return square_file(square) * 8 + 7 - square_rank(square)
+
+def build_symmetries(pawns: bool) -> tuple[list[list[int]], list[int]]:
+    """Return (square mapping for each white king square, canonical white king squares).
+
+    Applying the mapping of the white king's square to every piece gives the canonical
+    version of the position. Pawns only allow the left-right mirror."""
+    mappings = []
+    for king_square in range(BOARD_AREA):
+        mapping = list(range(BOARD_AREA))
+        if square_file(king_square) > 3:
+            mapping = [square ^ 7 for square in mapping]
+        if not pawns:
+            if square_rank(mapping[king_square]) > 3:
+                mapping = [square ^ 56 for square in mapping]
+            if square_rank(mapping[king_square]) > square_file(mapping[king_square]):
+                mapping = [transpose(square) for square in mapping]
+        mappings.append(mapping)
+    king_squares = sorted({mapping[king_square] for king_square, mapping in enumerate(mappings)})
+    return mappings, king_squares
+
+class TableLayout:
+    """Index arithmetic shared by the generator and the probes of one table."""
+    def __init__(self, piece_id: int):
+        self.piece_id = piece_id
+        self.mappings, self.king_squares = build_symmetries(piece_id == Board.PAWN_ID)
+        self.king_index = [-1] * BOARD_AREA
+        for index, square in enumerate(self.king_squares):
+            self.king_index[square] = index
+        self.size = 2 * len(self.king_squares) * BOARD_AREA * BOARD_AREA
+
+    def index(self, side_to_move: int, white_king: int, black_king: int, piece: int) -> int:
+        mapping = self.mappings[white_king]
+        king_index = self.king_index[mapping[white_king]]
+        return ((side_to_move * len(self.king_squares) + king_index) * BOARD_AREA + mapping[black_king]) * BOARD_AREA + mapping[piece]
+
+    def positions(self):
+        """Yield (index, side to move, white king, black king, piece) for every canonical slot of the table."""
+        index = 0
+        for side_to_move in (Board.WHITE_SIDE, Board.BLACK_SIDE):
+            for white_king in self.king_squares:
+                for black_king in range(BOARD_AREA):
+                    for piece in range(BOARD_AREA):
+                        yield index, side_to_move, white_king, black_king, piece
+                        index += 1
+
+LAYOUTS = {material: TableLayout(piece_id) for material, piece_id in MATERIALS.items()}
+
+
+# GENERATION
+
+def encode(side_to_move: int, white_king: int, black_king: int, piece_id: int, piece: int) -> tuple:
+    """Return the Board.encode_position() tuple of a position with white king and piece against black king."""
+    side_bitboards = [(1 << white_king) | (1 << piece), 1 << black_king]
+    piece_bitboards = [0] * 6
+    piece_bitboards[Board.KING_ID] = (1 << white_king) | (1 << black_king)
+    piece_bitboards[piece_id] |= 1 << piece
+    return tuple(side_bitboards) + tuple(piece_bitboards) + (side_to_move, 0, Board.NULL_POSITION, 0)
+
+def generate_table(material: str, tables: dict) -> npt.NDArray[np.uint8]:
+    """Build one table by retrograde analysis. tables must hold every table a promotion can lead into."""
+    layout = LAYOUTS[material]
+    piece_id = layout.piece_id
+    board = newboard.IntBoard(None, "w")
+    values = np.full(layout.size, INVALID, dtype=np.uint8)
+
+    # Plies to mate of every resolved position, -1 while unknown
+    plies = np.full(layout.size, -1, dtype=np.int32)
+    # Black to move positions lose once every reply is a white win - this counts the replies still unresolved
+    unresolved_replies = np.zeros(layout.size, dtype=np.int32)
+    parents = []
+    children = []
+    # Plies to mate -> white to move positions that mate in that many by promoting into another table
+    promotion_wins = {}
+    mates = []
+
+    # Forward pass - generate every position's moves once and record where they lead
+    for index, side_to_move, white_king, black_king, piece in layout.positions():
+        if (white_king == black_king or piece == white_king or piece == black_king
+                or newboard.IntBoard.KING_TABLE[white_king] & (1 << black_king)
+                or (piece_id == Board.PAWN_ID and (1 << piece) & RANK_EDGES)):
+            continue
+        board.load_position(encode(side_to_move, white_king, black_king, piece_id, piece))
+        # The side that just moved can't have left its king in check
+        if board.in_check(1 - side_to_move):
+            continue
+        values[index] = DRAW
+
+        moves = board.generate_legal_moves()
+        if not moves:
+            if board.in_check(side_to_move):
+                plies[index] = 0
+                mates.append(index)
+            continue
+
+        unresolved_replies[index] = len(moves)
+        for move in moves:
+            flag, from_pos, to_pos = board.decode_move(move)
+            if side_to_move == Board.BLACK_SIDE:
+                # Taking the piece draws, and such a move never resolves
+                if to_pos != piece:
+                    parents.append(index)
+                    children.append(layout.index(Board.WHITE_SIDE, white_king, to_pos, piece))
+            elif from_pos == white_king:
+                parents.append(index)
+                children.append(layout.index(Board.BLACK_SIDE, to_pos, black_king, piece))
+            elif flag in Board.PROMOTION_FLAGS:
+                promoted_id = Board.PROMOTION_FLAGS[flag]
+                if promoted_id in DRAWN_PIECES:
+                    continue
+                promoted = MATERIAL_NAMES[promoted_id]
+                entry = tables[promoted][LAYOUTS[promoted].index(Board.BLACK_SIDE, white_king, black_king, to_pos)]
+                if entry != DRAW:
+                    # The promotion leaves black to move, mated in entry - 1 plies, so this position mates in entry
+                    promotion_wins.setdefault(int(entry), []).append(index)
+            else:
+                parents.append(index)
+                children.append(layout.index(Board.BLACK_SIDE, white_king, black_king, to_pos))
+
+    # Group the move edges by child, so the positions leading to any one child are a slice
+    parents = np.array(parents, dtype=np.int64)
+    children = np.array(children, dtype=np.int64)
+    order = np.argsort(children, kind="stable")
+    parents = parents[order].tolist()
+    starts = np.searchsorted(children[order], np.arange(layout.size + 1)).tolist()
+    white_half = layout.size // 2
+
+    # Backward pass - positions mated in n plies resolve their parents at n + 1
+    frontier = mates
+    ply = 0
+    last_promotion_ply = max(promotion_wins, default=0)
+    while frontier or ply < last_promotion_ply:
+        next_frontier = []
+        for child in frontier:
+            for parent in parents[starts[child]:starts[child + 1]]:
+                if plies[parent] >= 0:
+                    continue
+                if parent < white_half:
+                    # White only needs one winning move
+                    plies[parent] = ply + 1
+                    next_frontier.append(parent)
+                else:
+                    unresolved_replies[parent] -= 1
+                    if unresolved_replies[parent] == 0:
+                        # Black's last reply to resolve is its longest defence
+                        plies[parent] = ply + 1
+                        next_frontier.append(parent)
+        ply += 1
+        for parent in promotion_wins.get(ply, []):
+            if plies[parent] < 0:
+                plies[parent] = ply
+                next_frontier.append(parent)
+        frontier = next_frontier
+
+    if ply + 1 >= INVALID:
+        raise Exception(f"{material} has mates too long to store: {ply} plies")
+    won = plies >= 0
+    values[won] = plies[won] + 1
+    return values
+
+
+# CACHING
+
+def table_path(material: str, directory: str = None) -> str:
+    return os.path.join(directory or TABLEBASE_DIR, f"{material}_v{TABLE_VERSION}.bin")
+
+def write_table(path: str, values: npt.NDArray[np.uint8]):
+    magictables.write_file_atomic(path, [values.tobytes()])
+
+def generate_tables(directory: str = None, report: bool = False) -> dict:
+    """Build every table and write it to directory. Returns {material: table}."""
+    tables = {}
+    for material in MATERIALS:
+        start = time.perf_counter()
+        tables[material] = generate_table(material, tables)
+        write_table(table_path(material, directory), tables[material])
+        if report:
+            values = tables[material]
+            won = values[(values != DRAW) & (values != INVALID)]
+            print(f"{material}: {np.count_nonzero(values != INVALID)} positions, {len(won)} won, "
+                  f"longest mate {int(won.max()) - 1} plies, {time.perf_counter() - start:.1f}s")
+    return tables
+
+
+# PROBING
+
+class Tablebases:
+    # Probe outcomes, from the side to move's point of view
+    LOSS = -1
+    DRAWN = 0
+    WIN = 1
+
+    def __init__(self, directory: str = None):
+        """Map every table found in directory. Tables that haven't been built are just not probed."""
+        self.tables = {}
+        for material in MATERIALS:
+            path = table_path(material, directory)
+            if os.path.exists(path) and os.path.getsize(path) == LAYOUTS[material].size:
+                self.tables[material] = np.memmap(path, dtype=np.uint8, mode="r")
+
+    def probe(self, board) -> tuple[int, int]:
+        """Return (outcome, plies to mate) for the board's position, or None if no table covers it.
+
+        Only looks at the bitboards and mailbox, so it is cheap enough to call at every node."""
+        white_bitboard, black_bitboard = (int(bb) for bb in board.side_bitboards)
+        occupied = white_bitboard | black_bitboard
+        if occupied.bit_count() > 3:
+            return None
+        # Two bare kings
+        if occupied.bit_count() == 2:
+            return self.DRAWN, 0
+
+        kings = int(board.piece_bitboards[Board.KING_ID])
+        piece = ((occupied & ~kings) & -(occupied & ~kings)).bit_length() - 1
+        piece_id = board.mailbox[piece] & Board.MAILBOX_PIECE_MASK
+        strong_side = board.mailbox[piece] >> Board.MAILBOX_SIDE_SHIFT
+        if piece_id in DRAWN_PIECES:
+            return self.DRAWN, 0
+        table = self.tables.get(MATERIAL_NAMES[piece_id])
+        if table is None:
+            return None
+
+        side_bitboards = (white_bitboard, black_bitboard)
+        strong_king = (kings & side_bitboards[strong_side]).bit_length() - 1
+        weak_king = (kings & side_bitboards[1 - strong_side]).bit_length() - 1
+        if strong_side == Board.BLACK_SIDE:
+            # Tables have white as the strong side - turn the board around
+            strong_king, weak_king, piece = strong_king ^ 56, weak_king ^ 56, piece ^ 56
+        side_to_move = Board.WHITE_SIDE if board.side_to_move == strong_side else Board.BLACK_SIDE
+
+        entry = int(table[LAYOUTS[MATERIAL_NAMES[piece_id]].index(side_to_move, strong_king, weak_king, piece)])
+        if entry == INVALID:
+            return None
+        if entry == DRAW:
+            return self.DRAWN, 0
+        return (self.WIN if side_to_move == Board.WHITE_SIDE else self.LOSS), entry - 1
+
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else None
+    generate_tables(directory, report=True)
@@ -0,0 +1,74 @@
+"""
+Time management for ChessAI searches.
+
+A search gets two limits: a soft one, after which no new iteration is started, and a
+hard one, after which the running iteration is abandoned. The clock is only read by
+poll(), which the search calls every few thousand nodes rather than at every node.
+
+stop() can be called from any thread to end a search early. A multiprocessing.Event
+can be passed in instead, so one stop reaches searches in several processes.
+"""
+
+import threading
+import time
+
+# Moves we plan for when the clock gives no moves-to-go
+DEFAULT_MOVES_TO_GO = 30
+# Kept back from the clock for communication and move-making lag
+MOVE_OVERHEAD_MS = 50
+# The hard limit is at most this many times the soft limit, and never more than this share of the clock
+HARD_LIMIT_FACTOR = 3
+MAX_CLOCK_SHARE = 0.5
+
+
+class TimeManager:
+    def __init__(self, stop_event = None):
+        self.start_time = 0.0
+        self.soft_deadline = None
+        self.hard_deadline = None
+        # An event passed in belongs to whoever made it, so start() leaves it alone
+        self.shared_stop = stop_event is not None
+        self.stop_event = stop_event if stop_event is not None else threading.Event()
+
+    def allocate(self, remaining_ms: float, increment_ms: float = 0, moves_to_go: int = None) -> tuple[float, float]:
+        """Return (soft, hard) time limits in milliseconds for one move, given the clock."""
+        if moves_to_go is None or moves_to_go <= 0:
+            moves_to_go = DEFAULT_MOVES_TO_GO
+        usable = max(remaining_ms - MOVE_OVERHEAD_MS, 1)
+        soft = min(usable / moves_to_go + increment_ms * 3 / 4, usable * MAX_CLOCK_SHARE)
+        hard = min(soft * HARD_LIMIT_FACTOR, usable * MAX_CLOCK_SHARE)
+        return soft, hard
+
+    def start(self, time_ms: float = None, remaining_ms: float = None, increment_ms: float = 0, moves_to_go: int = None):
+        """Start the clock for a search. time_ms is a fixed time for the move, otherwise the clock is allocated."""
+        self.start_time = time.perf_counter()
+        if not self.shared_stop:
+            self.stop_event.clear()
+        if time_ms is not None:
+            soft = hard = time_ms
+        elif remaining_ms is not None:
+            soft, hard = self.allocate(remaining_ms, increment_ms, moves_to_go)
+        else:
+            self.soft_deadline = self.hard_deadline = None
+            return
+        self.soft_deadline = self.start_time + soft / 1000
+        self.hard_deadline = self.start_time + hard / 1000
+
+    def stop(self):
+        """Ask the running search to stop. Safe to call from another thread."""
+        self.stop_event.set()
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.start_time) * 1000
+
+    def poll(self) -> bool:
+        """Return True if the search has to stop now - it was told to, or the hard limit has passed."""
+        if self.stop_event.is_set():
+            return True
+        return self.hard_deadline is not None and time.perf_counter() >= self.hard_deadline
+
+    def can_start_iteration(self) -> bool:
+        """Return False once the soft limit has passed, since the next iteration would not finish in time."""
+        if self.stop_event.is_set():
+            return False
+        return self.soft_deadline is None or time.perf_counter() < self.soft_deadline
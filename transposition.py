@@ -0,0 +1,187 @@
+"""
+Fixed size transposition table for ChessAI.
+
+Entries live in a NumPy structured array, two to a bucket: the first slot is
+depth-preferred and only gives way to a deeper search or an entry left over
+from an older search, the second is always replaced. The table never grows, so
+its memory use is set once by hash_mb.
+
+Each entry is two 64-bit words - the packed data, and the Zobrist key XORed with
+that data. A probe only accepts an entry whose words XOR back to the key, so the
+table can sit in shared memory and be written by several processes without locks:
+an entry torn by two writers at once just fails the check and reads as a miss.
+"""
+
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+ENTRY_DTYPE = np.dtype([
+    ("check", np.uint64),
+    ("data", np.uint64),
+])
+
+# Data word layout: move | score << 16 | depth << 32 | bound << 40 | age << 48.
+# Scores are stored offset by SCORE_OFFSET, so they are never negative
+SCORE_SHIFT = 16
+DEPTH_SHIFT = 32
+BOUND_SHIFT = 40
+AGE_SHIFT = 48
+SCORE_OFFSET = 1 << 15
+
+BUCKET_SIZE = 2
+DEPTH_PREFERRED = 0
+ALWAYS_REPLACE = 1
+
+
+class TranspositionTable:
+    # Bound types - BOUND_NONE marks an empty slot
+    BOUND_NONE = 0
+    BOUND_EXACT = 1
+    BOUND_LOWER = 2
+    BOUND_UPPER = 3
+
+    def __init__(self, hash_mb: int = 16, buffer = None):
+        """Allocate a table of hash_mb, or lay it over buffer (which must hold size_bytes(hash_mb)) if given."""
+        self.bucket_count = self.bucket_count_for(hash_mb)
+        self.bucket_mask = self.bucket_count - 1
+        self.hash_mb = hash_mb
+        self.shared_memory = None
+        self.finalizer = None
+
+        if buffer is None:
+            self.table = np.zeros((self.bucket_count, BUCKET_SIZE), dtype=ENTRY_DTYPE)
+        else:
+            self.table = np.ndarray((self.bucket_count, BUCKET_SIZE), dtype=ENTRY_DTYPE, buffer=buffer)
+        # Field views into the same memory - indexing these is much cheaper than indexing whole records
+        self.checks = self.table["check"]
+        self.datas = self.table["data"]
+
+        self.age = 0
+        self.reset_stats()
+
+    @staticmethod
+    def bucket_count_for(hash_mb: int) -> int:
+        # Round down to a power of two, so a bucket is picked with a mask instead of a modulo
+        buckets = max(1, (hash_mb * 1024 * 1024) // (ENTRY_DTYPE.itemsize * BUCKET_SIZE))
+        return 1 << (buckets.bit_length() - 1)
+
+    @classmethod
+    def size_bytes(cls, hash_mb: int) -> int:
+        return cls.bucket_count_for(hash_mb) * BUCKET_SIZE * ENTRY_DTYPE.itemsize
+
+    @classmethod
+    def create_shared(cls, hash_mb: int = 16):
+        """Return an empty table in a new shared memory block, which other processes can open with attach_shared()."""
+        memory = shared_memory.SharedMemory(create=True, size=cls.size_bytes(hash_mb))
+        table = cls(hash_mb, memory.buf)
+        table.table.fill(0)
+        table.shared_memory = memory
+        # Free the block when the table is collected or the interpreter exits, if close() hasn't already
+        table.finalizer = weakref.finalize(table, memory.unlink)
+        return table
+
+    @classmethod
+    def attach_shared(cls, name: str, hash_mb: int):
+        memory = shared_memory.SharedMemory(name=name)
+        table = cls(hash_mb, memory.buf)
+        table.shared_memory = memory
+        return table
+
+    def close(self, unlink: bool = False):
+        """Let go of the shared memory block, and free it too if unlink is set. The table can't be used after this."""
+        if self.shared_memory is None:
+            return
+        # The block can't be closed while NumPy still holds views into it
+        del self.table, self.checks, self.datas
+        self.shared_memory.close()
+        if unlink:
+            self.finalizer.detach()
+            self.shared_memory.unlink()
+        self.shared_memory = None
+
+    def reset_stats(self):
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.collisions = 0
+
+    def new_search(self):
+        """Age the table, so entries from earlier searches are the first to be replaced."""
+        self.age = (self.age + 1) & 0xFF
+
+    def clear(self):
+        self.table.fill(0)
+        self.age = 0
+        self.reset_stats()
+
+    def probe(self, key: int):
+        """Return (move, score, depth, bound) stored for key, or None."""
+        self.probes += 1
+        bucket = key & self.bucket_mask
+        checks = self.checks[bucket]
+        datas = self.datas[bucket]
+        for slot in range(BUCKET_SIZE):
+            data = int(datas[slot])
+            if data and int(checks[slot]) ^ data == key:
+                self.hits += 1
+                # Refresh the age, so entries still in use survive into the next search
+                if (data >> AGE_SHIFT) != self.age:
+                    data = (data & ~(0xFF << AGE_SHIFT)) | (self.age << AGE_SHIFT)
+                    self.write(bucket, slot, key, data)
+                return (data & 0xFFFF, ((data >> SCORE_SHIFT) & 0xFFFF) - SCORE_OFFSET,
+                        (data >> DEPTH_SHIFT) & 0xFF, (data >> BOUND_SHIFT) & 0xFF)
+        return None
+
+    def store(self, key: int, depth: int, bound: int, score: int, move: int):
+        self.stores += 1
+        bucket = key & self.bucket_mask
+        checks = self.checks[bucket]
+        datas = self.datas[bucket]
+        keys = [int(checks[slot]) ^ int(datas[slot]) for slot in range(BUCKET_SIZE)]
+        preferred = int(datas[DEPTH_PREFERRED])
+
+        if keys[ALWAYS_REPLACE] == key and datas[ALWAYS_REPLACE]:
+            slot = ALWAYS_REPLACE
+        elif (keys[DEPTH_PREFERRED] == key
+              or not preferred
+              or (preferred >> AGE_SHIFT) != self.age
+              or depth >= (preferred >> DEPTH_SHIFT) & 0xFF):
+            slot = DEPTH_PREFERRED
+        else:
+            slot = ALWAYS_REPLACE
+
+        old_data = int(datas[slot])
+        if keys[slot] == key and old_data:
+            # Keep the old best move if this search didn't find one
+            if not move:
+                move = old_data & 0xFFFF
+        elif old_data:
+            self.collisions += 1
+
+        data = (move | ((score + SCORE_OFFSET) << SCORE_SHIFT) | (max(depth, 0) << DEPTH_SHIFT)
+                | (bound << BOUND_SHIFT) | (self.age << AGE_SHIFT))
+        self.write(bucket, slot, key, data)
+
+    def write(self, bucket: int, slot: int, key: int, data: int):
+        self.datas[bucket, slot] = data
+        self.checks[bucket, slot] = key ^ data
+
+    def hashfull(self) -> int:
+        """Permille of slots holding an entry from the current search."""
+        sample = self.datas[:min(1000, self.bucket_count)]
+        used = np.count_nonzero((sample != 0) & ((sample >> np.uint64(AGE_SHIFT)) == self.age))
+        return int(used * 1000 // sample.size)
+
+    def stats(self) -> dict:
+        return {
+            "size_mb": self.table.nbytes / (1024 * 1024),
+            "entries": self.table.size,
+            "probes": self.probes,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.probes if self.probes else 0.0,
+            "stores": self.stores,
+            "collisions": self.collisions,
+            "hashfull": self.hashfull(),
+        }
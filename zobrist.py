@@ -0,0 +1,26 @@
+"""
+Zobrist keys for hashing newboard positions.
+
+A position's key is the XOR of one random 64-bit number per (side, piece, square),
+plus keys for the side to move, the castling rights and the en passant file. The
+keys come from a fixed seed, so a position hashes the same in every process.
+"""
+
+import random
+
+SEED = 0x5EED_C4E55
+
+_rng = random.Random(SEED)
+
+# PIECE_KEYS[side][piece_id][square]
+PIECE_KEYS = [[[_rng.getrandbits(64) for square in range(64)] for piece_id in range(6)] for side in range(2)]
+
+# XORed in when black is to move
+SIDE_KEY = _rng.getrandbits(64)
+
+# One key per combination of the 4 castling right bits
+CASTLING_KEYS = [_rng.getrandbits(64) for rights in range(16)]
+
+# Indexed by en passant square - only the file matters, and squares 64+ (no en passant) hash to 0
+EN_PASSANT_FILE_KEYS = [_rng.getrandbits(64) for file in range(8)]
+EN_PASSANT_KEYS = [EN_PASSANT_FILE_KEYS[square % 8] for square in range(64)] + [0, 0]